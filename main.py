@@ -1,22 +1,31 @@
 #!/usr/bin/env python3
 """Kitebird Capital — Unified Dashboard (Trading + Portfolio + News & Signals + Ops + Org)."""
 
-from flask import Flask, jsonify, render_template_string, request
-import threading, time, json, requests, datetime, os, re, glob
+from flask import Flask, Response, jsonify, render_template_string, request
+import threading, time, json, requests, queue, datetime, os, re, glob, heapq, random, mmap, sqlite3, functools, gzip, hashlib, copy, contextlib
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from difflib import SequenceMatcher
 from pathlib import Path
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
 
 app = Flask(__name__)
 HEADERS = {"User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7)"}
 
 # ─── Shared cache ───────────────────────────────────────────────────
-cache = {"vix": None, "funding": None, "arb": None, "updated": None}
-ops_cache = {"sessions": [], "totals": {}, "updated": None}
+# Read-copy-update: each section is an immutable dict, replaced by a single reference
+# swap. Readers take no lock; writers (the scheduler, serialized by _sched_lock) build
+# the next dict from the current one and swap it in.
+sections = {
+    "trading": {"vix": None, "funding": None, "arb": None, "updated": None},
+    "ops": {"sessions": [], "totals": {}, "updated": None},
+    "news": {"headlines": [], "updated": None},
+    "signals": {"markets": [], "updated": None},
+    "org": {"teams": [], "updated": None},
+}
 portfolio_cache = {"updated": None}
-news_cache = {"headlines": [], "updated": None}
-signals_cache = {"markets": [], "updated": None}
-org_cache = {"teams": [], "updated": None}
-lock = threading.Lock()
 
 PORTFOLIO_FILE = Path("/tmp/kitebird-portfolio.json")
 TEAM_VIEWS_FILE = Path("/tmp/kitebird-team-views.json")
@@ -26,26 +35,287 @@ ETF_PORTFOLIO_FILE = Path("/tmp/kitebird-etf-portfolio.json")
 CRYPTO_PORTFOLIO_FILE = Path("/tmp/kitebird-crypto-portfolio.json")
 SCREENSHOTS_DIR = Path(os.path.expanduser("~/ClawSystem/Control/Dux/tools/dashboard/screenshots"))
 
+# ─── Shared HTTP client ─────────────────────────────────────────────
+# One keep-alive session for every upstream call: pooled connections,
+# bounded jittered retries on 429/5xx, and a per-host concurrency cap.
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "16"))
+HTTP_RETRIES = int(os.environ.get("HTTP_RETRIES", "2"))
+HTTP_BACKOFF = float(os.environ.get("HTTP_BACKOFF", "0.5"))
+HTTP_PER_HOST_LIMIT = int(os.environ.get("HTTP_PER_HOST_LIMIT", "4"))
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_http = requests.Session()
+_http.mount("https://", HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE))
+_http.mount("http://", HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE))
+_host_slots = {}
+_host_slots_lock = threading.Lock()
+
+def _host_slot(url):
+    host = urlsplit(url).netloc
+    with _host_slots_lock:
+        if host not in _host_slots:
+            _host_slots[host] = threading.BoundedSemaphore(HTTP_PER_HOST_LIMIT)
+        return _host_slots[host]
+
+def _retry_delay(attempt, r=None):
+    retry_after = r.headers.get("Retry-After") if r is not None else None
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), 30.0)
+    return random.uniform(0, HTTP_BACKOFF * 2 ** attempt)  # full jitter
+
+def http_get(url, **kwargs):
+    """GET through the shared session.
+
+    Connection failures and 429/5xx responses are retried up to HTTP_RETRIES times
+    with full-jitter exponential backoff (Retry-After wins when present). A host slot
+    is held only while a request is in flight, never during backoff."""
+    kwargs.setdefault("headers", HEADERS)
+    slot = _host_slot(url)
+    for attempt in range(HTTP_RETRIES + 1):
+        try:
+            with slot:
+                r = _http.get(url, **kwargs)
+        except requests.ConnectionError:
+            if attempt == HTTP_RETRIES: raise
+            delay = _retry_delay(attempt)
+        else:
+            if r.status_code not in _RETRY_STATUSES or attempt == HTTP_RETRIES:
+                return r
+            delay = _retry_delay(attempt, r)
+        time.sleep(delay)
+
+# ─── Upstream circuit breakers ──────────────────────────────────────
+# One breaker per upstream API. When the error rate over the last
+# BREAKER_WINDOW calls crosses BREAKER_ERROR_RATE the circuit opens:
+# calls are skipped and the last good result is served (flagged stale)
+# until a half-open probe after BREAKER_COOLDOWN seconds succeeds.
+BREAKER_WINDOW = int(os.environ.get("BREAKER_WINDOW", "10"))
+BREAKER_MIN_CALLS = int(os.environ.get("BREAKER_MIN_CALLS", "3"))
+BREAKER_ERROR_RATE = float(os.environ.get("BREAKER_ERROR_RATE", "0.5"))
+BREAKER_COOLDOWN = float(os.environ.get("BREAKER_COOLDOWN", "120"))
+
+class UpstreamError(Exception):
+    pass
+
+def _expect_ok(r):
+    if r.status_code != 200:
+        raise UpstreamError(f"HTTP {r.status_code} from {urlsplit(r.url).netloc}" if getattr(r, "url", None)
+                            else f"HTTP {r.status_code}")
+    return r
+
+class CircuitBreaker:
+    """closed -> open on a high error rate -> half-open single probe after the cooldown."""
+
+    def __init__(self, name):
+        self.name = name
+        self.state = "closed"
+        self.window = deque(maxlen=BREAKER_WINDOW)  # recent outcomes, True = ok
+        self.latencies = deque(maxlen=200)          # ms, successes and failures alike
+        self.lock = threading.Lock()
+        self.opened_at = None
+        self.probing = False
+        self.calls = self.errors = self.skipped = 0
+        self.last_error = self.last_ok = None
+        self.last_good = None
+        self.stale = False
+
+    def allow(self):
+        with self.lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= BREAKER_COOLDOWN:
+                self.state = "half-open"
+            if self.state == "closed" or (self.state == "half-open" and not self.probing):
+                self.probing = self.state == "half-open"
+                return True
+            self.skipped += 1
+            return False
+
+    def record(self, ok, ms, error=None):
+        with self.lock:
+            self.calls += 1
+            self.window.append(ok)
+            self.latencies.append(ms)
+            if ok:
+                self.last_ok = _now_str()
+            else:
+                self.errors += 1
+                self.last_error = error
+            if self.state == "half-open":
+                self.probing = False
+                self.state = "closed" if ok else "open"
+                if ok: self.window.clear()
+                else: self.opened_at = time.monotonic()
+            elif not ok and len(self.window) >= BREAKER_MIN_CALLS \
+                    and self.window.count(False) / len(self.window) >= BREAKER_ERROR_RATE:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def status(self):
+        with self.lock:
+            lat = sorted(self.latencies)
+            pct = lambda q: lat[min(int(q * len(lat)), len(lat) - 1)] if lat else None
+            return {"state": self.state, "calls": self.calls, "errors": self.errors, "skipped": self.skipped,
+                    "error_rate": round(self.window.count(False) / len(self.window), 2) if self.window else 0,
+                    "p50_ms": pct(0.5), "p95_ms": pct(0.95), "stale": self.stale,
+                    "last_ok": self.last_ok, "last_error": self.last_error,
+                    "retry_in": round(max(BREAKER_COOLDOWN - (time.monotonic() - self.opened_at), 0), 1)
+                                if self.state == "open" else None}
+
+breakers = {"yahoo_vix": CircuitBreaker("yahoo_vix")}
+
+def upstream(name, empty=list):
+    """Guard a fetcher with the `name` breaker.
+
+    Failures are recorded with their cause instead of being swallowed; an open circuit
+    or a failed call returns the last good result (marking the breaker stale), or
+    `empty()` if there has never been one."""
+    breaker = breakers.setdefault(name, CircuitBreaker(name))
+    def wrap(fn):
+        @functools.wraps(fn)
+        def call(*args, **kwargs):
+            if breaker.allow():
+                t0 = time.perf_counter()
+                try:
+                    result = fn(*args, **kwargs)
+                except Exception as e:
+                    breaker.record(False, round((time.perf_counter() - t0) * 1000), f"{type(e).__name__}: {e}")
+                else:
+                    breaker.record(True, round((time.perf_counter() - t0) * 1000))
+                    breaker.last_good, breaker.stale = result, False
+                    return result
+            breaker.stale = breaker.last_good is not None
+            return breaker.last_good if breaker.last_good is not None else empty()
+        return call
+    return wrap
+
+def upstream_health():
+    return {name: b.status() for name, b in breakers.items()}
+
 # ═══════════════════════════════════════════════════════════════════
 # DATA FETCHERS — TRADING
 # ═══════════════════════════════════════════════════════════════════
 
-def fetch_vix():
+VIX_CACHE_FILE = Path(os.environ.get("VIX_CACHE_FILE", "/tmp/kitebird-vix-cache.json"))
+VIX_CACHE_BARS = int(os.environ.get("VIX_CACHE_BARS", "260"))
+
+def _load_vix_cache():
     try:
-        import yfinance as yf
-        vix = yf.Ticker("^VIX")
-        vix3m = yf.Ticker("^VIX3M")
-        hist = vix.history(period="6mo")
-        if hist.empty:
-            return {"error": "No VIX data"}
-        current = float(hist["Close"].iloc[-1])
-        avg_7 = float(hist["Close"].tail(7).mean())
-        avg_30 = float(hist["Close"].tail(30).mean())
-        avg_90 = float(hist["Close"].tail(90).mean())
-        high_90 = float(hist["Close"].tail(90).max())
-        low_90 = float(hist["Close"].tail(90).min())
-        hist3m = vix3m.history(period="5d")
-        vix3m_val = float(hist3m["Close"].iloc[-1]) if not hist3m.empty else None
+        return json.loads(VIX_CACHE_FILE.read_text())
+    except Exception:
+        return {}
+
+def _save_vix_cache(bars):
+    tmp = VIX_CACHE_FILE.with_suffix(".tmp")
+    tmp.write_text(json.dumps(bars, separators=(",", ":")))
+    os.replace(tmp, VIX_CACHE_FILE)
+
+def _merge_bars(col, dates, closes):
+    """Merge daily closes into a {"date": [...], "close": [...]} column pair; newer values win."""
+    merged = dict(zip(col["date"], col["close"]))
+    merged.update(zip(dates, closes))
+    keep = sorted(merged)[-VIX_CACHE_BARS:]
+    col["date"], col["close"] = keep, [merged[d] for d in keep]
+
+def _extend_vix_bars(yf, bars, ticker, seed_period):
+    """Pull only the bars after the cached tail (the whole seed_period on first use).
+
+    Returns an error string when Yahoo could not be reached; the cached series is kept.
+    yfinance usually reports a failure as an empty frame rather than raising, and a pull
+    from the cached tail date always includes that bar, so empty counts as a failure."""
+    col = bars.setdefault(ticker, {"date": [], "close": []})
+    if yf is None:
+        return "yfinance not installed"
+    try:
+        t = yf.Ticker(ticker)
+        hist = t.history(start=col["date"][-1]) if col["date"] else t.history(period=seed_period)
+    except Exception as e:
+        return f"{ticker}: {e}"
+    if hist.empty:
+        return f"{ticker}: no bars returned"
+    _merge_bars(col, [d.strftime("%Y-%m-%d") for d in hist.index], [float(c) for c in hist["Close"]])
+    return None
+
+VIX_TERM_STRUCTURE = os.environ.get("VIX_TERM_STRUCTURE", "0") == "1"
+VIX_TERM_TENORS = [("VIX9D", "^VIX9D", 9), ("VIX", "^VIX", 30), ("VIX3M", "^VIX3M", 93), ("VIX6M", "^VIX6M", 186)]
+
+def _vix_term_download(yf, bars):
+    """One batched yfinance download for every tenor plus VVIX.
+
+    Folds the ^VIX / ^VIX3M columns into the bar cache (so no per-ticker calls are
+    needed) and returns (error, term structure panel or None)."""
+    if yf is None:
+        return "yfinance not installed", None
+    import numpy as np
+    tickers = [t for _, t, _ in VIX_TERM_TENORS] + ["^VVIX"]
+    seeded = bool(bars.get("^VIX", {}).get("date"))
+    try:
+        df = yf.download(tickers, period="1mo" if seeded else "6mo", interval="1d",
+                         progress=False, auto_adjust=False, threads=False)
+    except Exception as e:
+        return str(e), None
+    if df is None or df.empty:
+        return "No term structure data", None
+    close = df["Close"].reindex(columns=tickers).ffill()
+    dates = [d.strftime("%Y-%m-%d") for d in close.index]
+    for t in ("^VIX", "^VIX3M"):
+        col = close[t]
+        ok = col.notna().to_numpy()
+        _merge_bars(bars.setdefault(t, {"date": [], "close": []}),
+                    [d for d, keep in zip(dates, ok) if keep], col[ok].astype(float).tolist())
+    levels = close.to_numpy(dtype=float)[-1]  # aligned latest row: tenors..., VVIX
+    days = np.array([d for _, _, d in VIX_TERM_TENORS], dtype=float)
+    tenor_levels = levels[:len(days)]
+    have = ~np.isnan(tenor_levels)
+    names = [n for (n, _, _), h in zip(VIX_TERM_TENORS, have) if h]
+    lv, dv = tenor_levels[have], days[have]
+    slopes = np.diff(lv) / np.diff(dv) * 30 if len(lv) > 1 else np.array([])
+    vix_level = tenor_levels[1] if have[1] else np.nan
+    curve = [{"tenor": n, "days": int(d), "level": round(float(l), 2),
+              "vs_vix": round(float(l / vix_level), 4) if not np.isnan(vix_level) else None}
+             for n, d, l in zip(names, dv, lv)]
+    segments = [{"from": names[i], "to": names[i + 1], "slope_30d": round(float(s), 3),
+                 "kind": "CONTANGO" if s > 0 else "BACKWARDATION" if s < 0 else "FLAT"}
+                for i, s in enumerate(slopes)]
+    kinds = {s["kind"] for s in segments}
+    return None, {"curve": curve, "segments": segments,
+                  "shape": kinds.pop() if len(kinds) == 1 else ("MIXED" if kinds else None),
+                  "vvix": round(float(levels[-1]), 2) if not np.isnan(levels[-1]) else None,
+                  "as_of": dates[-1]}
+
+def fetch_vix(term_structure=None):
+    try:
+        try:
+            import yfinance as yf
+        except ImportError:
+            yf = None
+        bars = _load_vix_cache()
+        before = json.dumps(bars, sort_keys=True)
+        term = None
+        breaker = breakers["yahoo_vix"]
+        if not breaker.allow():
+            err = "circuit open"
+        else:
+            t0 = time.perf_counter()
+            if VIX_TERM_STRUCTURE if term_structure is None else term_structure:
+                err, term = _vix_term_download(yf, bars)
+            else:
+                errors = [e for e in (_extend_vix_bars(yf, bars, "^VIX", "6mo"),
+                                      _extend_vix_bars(yf, bars, "^VIX3M", "5d")) if e]
+                err = "; ".join(errors) or None
+            breaker.record(err is None, round((time.perf_counter() - t0) * 1000), err)
+        breaker.stale = err is not None
+        if json.dumps(bars, sort_keys=True) != before:
+            _save_vix_cache(bars)
+        closes = bars.get("^VIX", {}).get("close", [])
+        if not closes:
+            return {"error": err or "No VIX data"}
+        current = closes[-1]
+        avg_7 = sum(closes[-7:]) / len(closes[-7:])
+        avg_30 = sum(closes[-30:]) / len(closes[-30:])
+        avg_90 = sum(closes[-90:]) / len(closes[-90:])
+        high_90 = max(closes[-90:])
+        low_90 = min(closes[-90:])
+        vix3m_closes = bars.get("^VIX3M", {}).get("close")
+        vix3m_val = vix3m_closes[-1] if vix3m_closes else None
         if current > 18:
             signal, color, note = "SELL SPREADS", "green", "High IV — premium selling favorable"
         elif current >= 14:
@@ -59,122 +329,769 @@ def fetch_vix():
             structure = {"kind": kind, "ratio": round(ratio, 4), "vix3m": round(vix3m_val, 2)}
         return {"current": round(current, 2), "signal": signal, "color": color, "note": note,
                 "avg_7": round(avg_7, 2), "avg_30": round(avg_30, 2), "avg_90": round(avg_90, 2),
-                "high_90": round(high_90, 2), "low_90": round(low_90, 2), "structure": structure}
+                "high_90": round(high_90, 2), "low_90": round(low_90, 2), "structure": structure,
+                "term_structure": term, "as_of": bars["^VIX"]["date"][-1], "stale": err is not None}
     except Exception as e:
         return {"error": str(e)}
 
 
-def _fetch_polymarket():
+POLYMARKET_URL = "https://gamma-api.polymarket.com/markets"
+KALSHI_BASE = "https://api.elections.kalshi.com/trade-api/v2"
+KALSHI_HEADERS = {"Accept": "application/json", "User-Agent": "Mozilla/5.0"}
+ARB_PAGINATE = os.environ.get("ARB_PAGINATE", "0") == "1"
+ARB_MAX_MARKETS = int(os.environ.get("ARB_MAX_MARKETS", "10000"))
+ARB_PAGE_SIZE = int(os.environ.get("ARB_PAGE_SIZE", "500"))
+ARB_PAGE_CONCURRENCY = int(os.environ.get("ARB_PAGE_CONCURRENCY", "4"))
+
+def _parse_polymarket(m):
+    title = m.get("question", m.get("title", ""))
+    yes = None
+    op = m.get("outcomePrices")
+    if op:
+        try: yes = float(json.loads(op)[0]) if isinstance(op, str) else float(op)
+        except: pass
+    if not yes:
+        tokens = m.get("tokens", [])
+        if tokens: yes = float(tokens[0].get("price", 0))
+    if title and yes and 0 < yes < 1:
+        return {"id": str(m.get("id") or m.get("conditionId") or title), "title": title.lower().strip(),
+                "raw_title": title, "yes": yes, "source": "Polymarket"}
+    return None
+
+def _parse_kalshi(mkt):
+    title = mkt.get("title", mkt.get("subtitle", ""))
+    price = float(mkt.get("yes_ask", 0) or mkt.get("last_price", 0) or 0)
+    if price > 1: price /= 100
+    if title and 0 < price < 1:
+        return {"id": mkt.get("ticker") or title, "title": title.lower().strip(),
+                "raw_title": title, "yes": price, "source": "Kalshi"}
+    return None
+
+def _polymarket_page(offset, limit):
+    params = {"closed": "false", "limit": limit, "offset": offset, "order": "volume24hr", "ascending": "false"}
+    body = _expect_ok(http_get(POLYMARKET_URL, params=params, timeout=15, headers=HEADERS)).json()
+    return body if isinstance(body, list) else body.get("data", [])
+
+def iter_polymarket(max_markets=None, page_size=None, concurrency=None):
+    """Yield parsed Polymarket records page by page, walking offsets `concurrency` pages at a time.
+
+    Each raw page is reduced to compact records as soon as it arrives, so at most one
+    window of JSON pages is held in memory. Stops at the first short page; a failed page raises."""
+    max_markets = max_markets or ARB_MAX_MARKETS
+    page_size = page_size or ARB_PAGE_SIZE
+    concurrency = max(1, concurrency or ARB_PAGE_CONCURRENCY)
+    count, offset = 0, 0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        while count < max_markets:
+            offsets = [offset + n * page_size for n in range(concurrency)]
+            for page in pool.map(lambda o: _polymarket_page(o, page_size), offsets):
+                for m in page:
+                    rec = _parse_polymarket(m)
+                    if rec:
+                        yield rec
+                        count += 1
+                        if count >= max_markets: return
+                if len(page) < page_size: return
+            offset += concurrency * page_size
+
+def iter_kalshi(max_markets=None, page_size=None, max_pages=None):
+    """Yield parsed Kalshi records page by page, following the response cursor.
+
+    Kalshi pages are cursor-chained, so they are necessarily fetched one after another."""
+    max_markets = max_markets or ARB_MAX_MARKETS
+    page_size = min(page_size or ARB_PAGE_SIZE, 1000)
+    count, pages, cursor = 0, 0, None
+    while count < max_markets and pages != max_pages:
+        pages += 1
+        params = {"limit": page_size, "status": "open"}
+        if cursor: params["cursor"] = cursor
+        body = _expect_ok(http_get(f"{KALSHI_BASE}/markets", params=params, headers=KALSHI_HEADERS, timeout=15)).json()
+        for mkt in body.get("markets", []):
+            rec = _parse_kalshi(mkt)
+            if rec:
+                yield rec
+                count += 1
+                if count >= max_markets: return
+        cursor = body.get("cursor")
+        if not cursor or not body.get("markets"): return
+
+# The full paginated listing and the single first page get separate breakers, so a
+# failed full fetch never falls back to a one-page result (or the other way round).
+@upstream("polymarket_pages")
+def _fetch_polymarket_all():
+    return list(iter_polymarket())
+
+@upstream("polymarket")
+def _fetch_polymarket_first():
+    return [rec for rec in map(_parse_polymarket, _polymarket_page(0, 100)) if rec]
+
+@upstream("kalshi_pages")
+def _fetch_kalshi_all():
+    return list(iter_kalshi())
+
+@upstream("kalshi")
+def _fetch_kalshi_first():
+    return list(iter_kalshi(page_size=100, max_pages=1))
+
+def _fetch_polymarket(paginate=None):
+    return _fetch_polymarket_all() if (ARB_PAGINATE if paginate is None else paginate) else _fetch_polymarket_first()
+
+def _fetch_kalshi(paginate=None):
+    return _fetch_kalshi_all() if (ARB_PAGINATE if paginate is None else paginate) else _fetch_kalshi_first()
+
+ARB_MIN_MATCH = 0.55
+ARB_MIN_SPREAD = 3
+ARB_MIN_SHARED_TOKENS = int(os.environ.get("ARB_MIN_SHARED_TOKENS", "1"))
+ARB_MAX_POSTING = int(os.environ.get("ARB_MAX_POSTING", "250"))
+_TITLE_STOPWORDS = frozenset("a an and at be by for from in is of on or the to will with".split())
+
+def _title_tokens(title):
+    return {t for t in re.findall(r"[a-z0-9]+", title) if len(t) > 1 and t not in _TITLE_STOPWORDS}
+
+def _build_token_index(markets):
+    """Inverted index: normalized title token -> indices of markets containing it."""
+    index = {}
+    for i, m in enumerate(markets):
+        for tok in _title_tokens(m["title"]):
+            index.setdefault(tok, []).append(i)
+    return index
+
+def _arb_candidates(poly, kalshi):
+    """Map kalshi index -> poly indices sharing enough informative tokens to be worth scoring.
+
+    Tokens listed on more than ARB_MAX_POSTING Kalshi markets carry no signal and are
+    skipped, which keeps the candidate count linear in the number of markets."""
+    index = _build_token_index(kalshi)
+    by_kalshi = {}
+    for i, p in enumerate(poly):
+        shared = {}
+        for tok in _title_tokens(p["title"]):
+            posting = index.get(tok)
+            if posting and len(posting) <= ARB_MAX_POSTING:
+                for j in posting:
+                    shared[j] = shared.get(j, 0) + 1
+        for j, n in shared.items():
+            if n >= ARB_MIN_SHARED_TOKENS:
+                by_kalshi.setdefault(j, []).append(i)
+    return by_kalshi
+
+def _score_difflib(poly, kalshi, candidates):
+    """Yield (i, j, ratio) per candidate pair with difflib's SequenceMatcher.
+
+    Pairs whose exact upper bound is already below ARB_MIN_MATCH report that bound
+    instead of the full ratio."""
+    sm = SequenceMatcher(None)
+    for j, idxs in candidates.items():
+        sm.set_seq2(kalshi[j]["title"])  # b-side preprocessing is the expensive half; reuse it
+        for i in idxs:
+            sm.set_seq1(poly[i]["title"])
+            bound = sm.real_quick_ratio()
+            if bound >= ARB_MIN_MATCH:
+                bound = sm.quick_ratio()
+            yield i, j, (sm.ratio() if bound >= ARB_MIN_MATCH else bound)
+
+def _char_ngrams(title, n=3):
+    padded = f" {title} "
+    grams = {}
+    for x in range(len(padded) - n + 1):
+        g = padded[x:x+n]
+        grams[g] = grams.get(g, 0) + 1
+    return grams
+
+def _score_ngram(poly, kalshi, candidates):
+    """Yield (i, j, cosine) per candidate pair over character trigram count vectors.
+
+    All candidate similarities are computed in one sparse row-wise product when SciPy
+    is installed; otherwise the same cosine is taken pair by pair from dicts."""
+    pairs = [(i, j) for j, idxs in candidates.items() for i in idxs]
+    if not pairs:
+        return
+    grams_p = [_char_ngrams(m["title"]) for m in poly]
+    grams_k = [_char_ngrams(m["title"]) for m in kalshi]
     try:
-        r = requests.get("https://gamma-api.polymarket.com/markets?closed=false&limit=100&order=volume24hr&ascending=false", timeout=15, headers=HEADERS)
-        if r.status_code != 200: return []
-        markets = []
-        for m in (r.json() if isinstance(r.json(), list) else r.json().get("data", [])):
-            title = m.get("question", m.get("title", ""))
-            yes = None
-            op = m.get("outcomePrices")
-            if op:
-                try: yes = float(json.loads(op)[0]) if isinstance(op, str) else float(op)
-                except: pass
-            if not yes:
-                tokens = m.get("tokens", [])
-                if tokens: yes = float(tokens[0].get("price", 0))
-            if title and yes and 0 < yes < 1:
-                markets.append({"title": title.lower().strip(), "raw_title": title, "yes": yes, "source": "Polymarket"})
-        return markets
-    except: return []
-
-def _fetch_kalshi():
-    base = "https://api.elections.kalshi.com/trade-api/v2"
-    h = {"Accept": "application/json", "User-Agent": "Mozilla/5.0"}
-    markets = []
+        import numpy as np
+        from scipy import sparse
+    except ImportError:
+        norm_p = [sum(v*v for v in g.values()) ** 0.5 for g in grams_p]
+        norm_k = [sum(v*v for v in g.values()) ** 0.5 for g in grams_k]
+        for i, j in pairs:
+            a, b = grams_p[i], grams_k[j]
+            if len(a) > len(b): a, b = b, a
+            dot = sum(v * b.get(g, 0) for g, v in a.items())
+            yield i, j, dot / (norm_p[i] * norm_k[j]) if dot else 0.0
+        return
+    vocab = {}
+    def matrix(grams):
+        rows, cols, vals = [], [], []
+        for r, g in enumerate(grams):
+            for gram, v in g.items():
+                rows.append(r); cols.append(vocab.setdefault(gram, len(vocab))); vals.append(v)
+        return rows, cols, vals
+    mp, mk = matrix(grams_p), matrix(grams_k)
+    P = sparse.csr_matrix((mp[2], (mp[0], mp[1])), shape=(len(grams_p), len(vocab)), dtype=np.float32)
+    K = sparse.csr_matrix((mk[2], (mk[0], mk[1])), shape=(len(grams_k), len(vocab)), dtype=np.float32)
+    for M in (P, K):  # L2-normalize rows in place so the dot product is the cosine
+        norms = np.sqrt(np.asarray(M.multiply(M).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        M.data /= np.repeat(norms, np.diff(M.indptr))
+    I = np.fromiter((i for i, _ in pairs), dtype=np.int64, count=len(pairs))
+    J = np.fromiter((j for _, j in pairs), dtype=np.int64, count=len(pairs))
+    sims = np.asarray(P[I].multiply(K[J]).sum(axis=1)).ravel()
+    for (i, j), s in zip(pairs, sims.tolist()):
+        yield i, j, s
+
+ARB_SCORERS = {
+    "difflib": (_score_difflib, ARB_MIN_MATCH),
+    "ngram": (_score_ngram, float(os.environ.get("ARB_NGRAM_MIN_MATCH", "0.55"))),
+}
+ARB_SCORER = os.environ.get("ARB_SCORER", "difflib")
+_arb_snapshot = {"poly": [], "kalshi": []}
+
+# ─── Pair-similarity memo ───────────────────────────────────────────
+# Titles rarely change between refreshes, so similarity is memoized per
+# (scorer, poly title, kalshi title) in a bounded LRU, optionally on disk.
+ARB_SIM_CACHE_SIZE = int(os.environ.get("ARB_SIM_CACHE_SIZE", "200000"))
+ARB_SIM_CACHE_FILE = os.environ.get("ARB_SIM_CACHE_FILE", "")
+_sim_cache = OrderedDict()
+_sim_cache_stats = {"hits": 0, "misses": 0, "evictions": 0, "dirty": False}
+_sim_cache_lock = threading.Lock()
+
+def _sim_cache_split(scorer, poly, kalshi, candidates):
+    """Return (memoized [(i, j, ratio)], candidates still to score)."""
+    known, missing = [], {}
+    with _sim_cache_lock:
+        for j, idxs in candidates.items():
+            kt = kalshi[j]["title"]
+            for i in idxs:
+                key = (scorer, poly[i]["title"], kt)
+                ratio = _sim_cache.get(key)
+                if ratio is None:
+                    missing.setdefault(j, []).append(i)
+                else:
+                    _sim_cache.move_to_end(key)
+                    known.append((i, j, ratio))
+        _sim_cache_stats["hits"] += len(known)
+        _sim_cache_stats["misses"] += sum(len(v) for v in missing.values())
+    return known, missing
+
+def _sim_cache_store(scorer, poly, kalshi, scored):
+    with _sim_cache_lock:
+        for i, j, ratio in scored:
+            _sim_cache[(scorer, poly[i]["title"], kalshi[j]["title"])] = ratio
+        while len(_sim_cache) > ARB_SIM_CACHE_SIZE:
+            _sim_cache.popitem(last=False)
+            _sim_cache_stats["evictions"] += 1
+        if scored:
+            _sim_cache_stats["dirty"] = True
+
+def sim_cache_stats():
+    with _sim_cache_lock:
+        lookups = _sim_cache_stats["hits"] + _sim_cache_stats["misses"]
+        return {"size": len(_sim_cache), "max_size": ARB_SIM_CACHE_SIZE,
+                "hits": _sim_cache_stats["hits"], "misses": _sim_cache_stats["misses"],
+                "evictions": _sim_cache_stats["evictions"],
+                "hit_rate": round(_sim_cache_stats["hits"] / lookups, 4) if lookups else 0,
+                "file": ARB_SIM_CACHE_FILE or None}
+
+def load_sim_cache():
+    if not ARB_SIM_CACHE_FILE or not os.path.exists(ARB_SIM_CACHE_FILE):
+        return
     try:
-        r = requests.get(f"{base}/markets", params={"limit": 100, "status": "open"}, headers=h, timeout=15)
-        if r.status_code != 200: return []
-        for mkt in r.json().get("markets", []):
-            title = mkt.get("title", mkt.get("subtitle", ""))
-            price = float(mkt.get("yes_ask", 0) or mkt.get("last_price", 0) or 0)
-            if price > 1: price /= 100
-            if title and 0 < price < 1:
-                markets.append({"title": title.lower().strip(), "raw_title": title, "yes": price, "source": "Kalshi"})
-    except: pass
-    return markets
-
-def fetch_arb():
+        rows = json.loads(Path(ARB_SIM_CACHE_FILE).read_text())
+    except Exception:
+        return
+    with _sim_cache_lock:
+        for scorer, pt, kt, ratio in rows[-ARB_SIM_CACHE_SIZE:]:
+            _sim_cache[(scorer, pt, kt)] = ratio
+
+def save_sim_cache():
+    """Write the memo to ARB_SIM_CACHE_FILE (oldest first) if it changed since the last save."""
+    if not ARB_SIM_CACHE_FILE:
+        return
+    with _sim_cache_lock:
+        if not _sim_cache_stats["dirty"]:
+            return
+        rows = [[*key, ratio] for key, ratio in _sim_cache.items()]
+        _sim_cache_stats["dirty"] = False
+    tmp = ARB_SIM_CACHE_FILE + ".tmp"
+    Path(tmp).write_text(json.dumps(rows, separators=(",", ":")))
+    os.replace(tmp, ARB_SIM_CACHE_FILE)
+
+load_sim_cache()
+
+def _score_pairs(scorer, poly, kalshi, candidates, use_cache=True):
+    """Return ([(i, j, ratio)], pairs actually scored); memoized pairs skip the scorer."""
+    score = ARB_SCORERS[scorer][0]
+    if not use_cache:
+        results = list(score(poly, kalshi, candidates))
+        return results, len(results)
+    known, missing = _sim_cache_split(scorer, poly, kalshi, candidates)
+    fresh = list(score(poly, kalshi, missing))
+    _sim_cache_store(scorer, poly, kalshi, fresh)
+    return known + fresh, len(fresh)
+
+def _arb_opp(p, k, ratio):
+    spread = abs(p["yes"] - k["yes"]) * 100
+    if spread <= ARB_MIN_SPREAD:
+        return None
+    return {"poly_title": p["raw_title"], "kalshi_title": k["raw_title"],
+            "poly_yes": round(p["yes"]*100, 1), "kalshi_yes": round(k["yes"]*100, 1),
+            "spread": round(spread, 1), "match": round(ratio*100)}
+
+def _arb_opps(poly, kalshi, scorer, use_cache=True):
+    """Score the full candidate set with the named scorer and return (opps, pairs_scored, score_ms)."""
+    min_match = ARB_SCORERS[scorer][1]
+    t0 = time.perf_counter()
+    results, scored = _score_pairs(scorer, poly, kalshi, _arb_candidates(poly, kalshi), use_cache)
+    found = []
+    for i, j, ratio in results:
+        if ratio >= min_match:
+            opp = _arb_opp(poly[i], kalshi[j], ratio)
+            if opp:
+                found.append((-opp["spread"], i, j, opp))
+    found.sort(key=lambda x: x[:3])
+    return [o for *_, o in found], scored, round((time.perf_counter() - t0) * 1000, 1)
+
+# ─── Incremental arb state ──────────────────────────────────────────
+# Matched pairs survive between refreshes. Each cycle diffs the venue
+# snapshots by market id: only new markets are title-matched, and only
+# pairs touching a market whose price moved get their spread recomputed.
+_arb_state = {"scorer": None, "poly": {}, "kalshi": {}, "pidx": {}, "kidx": {},
+              "by_poly": {}, "by_kalshi": {}, "ratios": {}, "opps": {}}
+_arb_lock = threading.Lock()
+
+def _arb_reset(scorer):
+    _arb_state.update(scorer=scorer, poly={}, kalshi={}, pidx={}, kidx={},
+                      by_poly={}, by_kalshi={}, ratios={}, opps={})
+
+def _arb_diff(old, markets):
+    """Split a venue snapshot into (markets by id, new ids, moved ids, removed ids).
+
+    A market whose title changed counts as removed and new."""
+    cur = {m["id"]: m for m in markets}
+    new, moved = [], []
+    for mid, m in cur.items():
+        o = old.get(mid)
+        if o is None or o["title"] != m["title"]:
+            new.append(mid)
+        elif o["yes"] != m["yes"]:
+            moved.append(mid)
+    removed = [mid for mid, o in old.items() if mid not in cur or cur[mid]["title"] != o["title"]]
+    return cur, new, moved, removed
+
+def _arb_forget(side, mid):
+    st = _arb_state
+    idx, own, other = ("pidx", "by_poly", "by_kalshi") if side == "poly" else ("kidx", "by_kalshi", "by_poly")
+    for tok in _title_tokens(st[side][mid]["title"]):
+        posting = st[idx].get(tok)
+        if posting:
+            posting.discard(mid)
+            if not posting: del st[idx][tok]
+    for peer in st[own].pop(mid, ()):
+        key = (mid, peer) if side == "poly" else (peer, mid)
+        st[other][peer].discard(mid)
+        st["ratios"].pop(key, None)
+        st["opps"].pop(key, None)
+
+def _arb_new_candidates(new_p, new_k):
+    """Candidate (poly id, kalshi id) pairs involving at least one new market.
+
+    Same pruning rule as _arb_candidates: a shared token only counts while it is
+    listed on at most ARB_MAX_POSTING Kalshi markets."""
+    st = _arb_state
+    shared = {}
+    for pid in new_p:
+        for tok in _title_tokens(st["poly"][pid]["title"]):
+            posting = st["kidx"].get(tok)
+            if posting and len(posting) <= ARB_MAX_POSTING:
+                for kid in posting:
+                    shared[(pid, kid)] = shared.get((pid, kid), 0) + 1
+    fresh_p = set(new_p)
+    for kid in new_k:
+        for tok in _title_tokens(st["kalshi"][kid]["title"]):
+            if len(st["kidx"].get(tok, ())) <= ARB_MAX_POSTING:
+                for pid in st["pidx"].get(tok, ()):
+                    if pid not in fresh_p:
+                        shared[(pid, kid)] = shared.get((pid, kid), 0) + 1
+    return [key for key, n in shared.items() if n >= ARB_MIN_SHARED_TOKENS]
+
+def _arb_update(poly, kalshi, scorer):
+    """Fold a fresh venue snapshot into _arb_state and return (opps, stats)."""
+    st = _arb_state
+    if st["scorer"] != scorer:
+        _arb_reset(scorer)
+    cur_p, new_p, moved_p, gone_p = _arb_diff(st["poly"], poly)
+    cur_k, new_k, moved_k, gone_k = _arb_diff(st["kalshi"], kalshi)
+    for pid in gone_p: _arb_forget("poly", pid)
+    for kid in gone_k: _arb_forget("kalshi", kid)
+    st["poly"], st["kalshi"] = cur_p, cur_k
+    for side, idx, ids in (("poly", "pidx", new_p), ("kalshi", "kidx", new_k)):
+        for mid in ids:
+            for tok in _title_tokens(st[side][mid]["title"]):
+                st[idx].setdefault(tok, set()).add(mid)
+    pairs = _arb_new_candidates(new_p, new_k)
+    # Score in index space so the batch scorers and the similarity memo apply unchanged
+    pids = list({pid for pid, _ in pairs}); kids = list({kid for _, kid in pairs})
+    ppos = {pid: i for i, pid in enumerate(pids)}; kpos = {kid: j for j, kid in enumerate(kids)}
+    candidates = {}
+    for pid, kid in pairs:
+        candidates.setdefault(kpos[kid], []).append(ppos[pid])
+    results, scored = _score_pairs(scorer, [cur_p[p] for p in pids], [cur_k[k] for k in kids], candidates)
+    min_match = ARB_SCORERS[scorer][1]
+    dirty = set()
+    for i, j, ratio in results:
+        if ratio >= min_match:
+            key = (pids[i], kids[j])
+            st["ratios"][key] = ratio
+            st["by_poly"].setdefault(key[0], set()).add(key[1])
+            st["by_kalshi"].setdefault(key[1], set()).add(key[0])
+            dirty.add(key)
+    for pid in moved_p: dirty.update((pid, kid) for kid in st["by_poly"].get(pid, ()))
+    for kid in moved_k: dirty.update((pid, kid) for pid in st["by_kalshi"].get(kid, ()))
+    for key in dirty:
+        opp = _arb_opp(cur_p[key[0]], cur_k[key[1]], st["ratios"][key])
+        if opp: st["opps"][key] = opp
+        else: st["opps"].pop(key, None)
+    order_p = {m["id"]: n for n, m in enumerate(poly)}
+    order_k = {m["id"]: n for n, m in enumerate(kalshi)}
+    top = heapq.nsmallest(20, st["opps"].items(),
+                          key=lambda kv: (-kv[1]["spread"], order_p[kv[0][0]], order_k[kv[0][1]]))
+    stats = {"new_markets": len(new_p) + len(new_k), "moved_markets": len(moved_p) + len(moved_k),
+             "removed_markets": len(gone_p) + len(gone_k), "spreads_recomputed": len(dirty),
+             "matched_pairs": len(st["ratios"]), "pairs_scored": scored}
+    return [opp for _, opp in top], stats
+
+def fetch_arb(scorer=None):
+    scorer = scorer or ARB_SCORER
     try:
+        if scorer not in ARB_SCORERS:
+            raise ValueError(f"unknown arb scorer {scorer!r}")
         poly = _fetch_polymarket()
         kalshi = _fetch_kalshi()
+        _arb_snapshot.update(poly=poly, kalshi=kalshi)
+        if cluster["role"] == "leader":
+            try:
+                _share_payload("_arb_markets", _arb_snapshot)  # for /api/arb/compare on followers
+            except sqlite3.Error:
+                pass
+        stale = [n for n in ("polymarket", "kalshi") if breakers[n + "_pages" if ARB_PAGINATE else n].stale]
         if not poly or not kalshi:
-            return {"poly_count": len(poly), "kalshi_count": len(kalshi), "opps": []}
-        opps = []
-        for p in poly:
-            for k in kalshi:
-                ratio = SequenceMatcher(None, p["title"], k["title"]).ratio()
-                if ratio >= 0.55:
-                    spread = abs(p["yes"] - k["yes"]) * 100
-                    if spread > 3:
-                        opps.append({"poly_title": p["raw_title"], "kalshi_title": k["raw_title"],
-                                     "poly_yes": round(p["yes"]*100, 1), "kalshi_yes": round(k["yes"]*100, 1),
-                                     "spread": round(spread, 1), "match": round(ratio*100)})
-        opps.sort(key=lambda x: -x["spread"])
-        return {"poly_count": len(poly), "kalshi_count": len(kalshi), "opps": opps[:20]}
+            return {"poly_count": len(poly), "kalshi_count": len(kalshi), "opps": [], "stale_sources": stale}
+        t0 = time.perf_counter()
+        with _arb_lock:
+            try:
+                opps, stats = _arb_update(poly, kalshi, scorer)
+            except Exception:
+                _arb_reset(scorer)  # half-folded state would count unscored markets as seen
+                raise
+        ms = round((time.perf_counter() - t0) * 1000, 1)
+        save_sim_cache()
+        return {"poly_count": len(poly), "kalshi_count": len(kalshi), "opps": opps,
+                "stale_sources": stale, "scorer": scorer, "pairs_scored": stats.pop("pairs_scored"), "score_ms": ms,
+                "incremental": stats, "sim_cache": sim_cache_stats()}
     except Exception as e:
         return {"error": str(e), "opps": []}
 
-
+def compare_arb_scorers():
+    """Run every scorer over the last fetched arb snapshot and report runtime and overlap."""
+    markets = arb_markets()
+    poly, kalshi = markets["poly"], markets["kalshi"]
+    results = {}
+    for name in ARB_SCORERS:
+        opps, scored, ms = _arb_opps(poly, kalshi, name, use_cache=False)
+        results[name] = {"pairs_scored": scored, "score_ms": ms, "matches": len(opps),
+                         "keys": {(o["poly_title"], o["kalshi_title"]) for o in opps}, "top": opps[:20]}
+    base = results.get("difflib", {}).get("keys", set())
+    for r in results.values():
+        keys = r.pop("keys")
+        r["overlap_with_difflib"] = len(keys & base)
+    return {"poly_count": len(poly), "kalshi_count": len(kalshi), "scorers": results}
+
+
+@upstream("binance")
 def _fetch_binance():
-    try:
-        r = requests.get("https://fapi.binance.com/fapi/v1/premiumIndex", timeout=10, headers=HEADERS)
-        if r.status_code != 200: return []
-        return [{"symbol": i["symbol"], "rate": float(i.get("lastFundingRate", 0)), "source": "Binance"}
-                for i in r.json() if float(i.get("lastFundingRate", 0)) != 0]
-    except: return []
+    r = _expect_ok(http_get("https://fapi.binance.com/fapi/v1/premiumIndex", timeout=10, headers=HEADERS))
+    return [{"symbol": i["symbol"], "rate": float(i.get("lastFundingRate", 0)), "source": "Binance"}
+            for i in r.json() if float(i.get("lastFundingRate", 0)) != 0]
 
+@upstream("bybit")
 def _fetch_bybit():
-    try:
-        r = requests.get("https://api.bybit.com/v5/market/tickers?category=linear", timeout=10, headers=HEADERS)
-        if r.status_code != 200: return []
-        return [{"symbol": i["symbol"], "rate": float(i.get("fundingRate", 0)), "source": "Bybit"}
-                for i in r.json().get("result", {}).get("list", []) if float(i.get("fundingRate", 0)) != 0]
-    except: return []
+    r = _expect_ok(http_get("https://api.bybit.com/v5/market/tickers?category=linear", timeout=10, headers=HEADERS))
+    return [{"symbol": i["symbol"], "rate": float(i.get("fundingRate", 0)), "source": "Bybit"}
+            for i in r.json().get("result", {}).get("list", []) if float(i.get("fundingRate", 0)) != 0]
 
+@upstream("gateio")
 def _fetch_gateio():
-    try:
-        r = requests.get("https://api.gateio.ws/api/v4/futures/usdt/contracts", timeout=10, headers=HEADERS)
-        if r.status_code != 200: return []
-        return [{"symbol": i["name"].replace("_", ""), "rate": float(i.get("funding_rate", 0)), "source": "Gate.io"}
-                for i in r.json() if float(i.get("funding_rate", 0)) != 0]
-    except: return []
-
-def fetch_funding():
+    r = _expect_ok(http_get("https://api.gateio.ws/api/v4/futures/usdt/contracts", timeout=10, headers=HEADERS))
+    return [{"symbol": i["name"].replace("_", ""), "rate": float(i.get("funding_rate", 0)), "source": "Gate.io"}
+            for i in r.json() if float(i.get("funding_rate", 0)) != 0]
+
+# Quote suffixes are matched longest-first so USDT never leaves a stray "T". USDT, the
+# quote every venue lists, is the plain base (BTC); other quotes stay in the key (BTC-USDC)
+# so a USDC-margined rate is never joined against a USDT one. Bybit's xxxPERP contracts
+# are USDC-margined. Multiplier prefixes map e.g. 1000PEPE onto PEPE (funding is a rate,
+# not a price).
+_QUOTE_SUFFIXES = ("USDT", "USDC", "BUSD", "PERP", "USD")
+_QUOTE_KEYS = {"USDT": "", "USDC": "USDC", "BUSD": "BUSD", "PERP": "USDC", "USD": "USD"}
+_MULTIPLIER_PREFIXES = ("1000000", "10000", "1000", "1M")
+SYMBOL_ALIASES = {"XBT": "BTC", "LUNA2": "LUNA", "SHIB1000": "SHIB"}
+FUNDING_SPREADS_TOP = int(os.environ.get("FUNDING_SPREADS_TOP", "10"))
+
+def canonical_symbol(raw):
+    """Exchange perp symbol -> canonical key, e.g. BTC_USDT / 1000PEPEUSDT / BTCPERP -> BTC / PEPE / BTC-USDC."""
+    sym = re.sub(r"[-_/:]", "", raw.upper())
+    quote = ""
+    for q in _QUOTE_SUFFIXES:
+        if sym.endswith(q) and len(sym) > len(q):
+            sym, quote = sym[:-len(q)], _QUOTE_KEYS[q]
+            break
+    for m in _MULTIPLIER_PREFIXES:
+        if sym.startswith(m) and len(sym) - len(m) >= 2 and not sym[len(m)].isdigit():
+            sym = sym[len(m):]
+            break
+    sym = SYMBOL_ALIASES.get(sym, sym)
+    return f"{sym}-{quote}" if quote else sym
+
+def _venue_book(rows):
+    """{canonical symbol: {venue: row}}. Where a venue lists several contracts under one key
+    (PEPEUSDT and 1000PEPEUSDT), the shortest symbol (the unscaled contract) wins, whatever
+    order the API returned them in."""
+    book = {}
+    for r in rows:
+        venues = book.setdefault(canonical_symbol(r["symbol"]), {})
+        cur = venues.get(r["source"])
+        if cur is None or (len(r["symbol"]), r["symbol"]) < (len(cur["symbol"]), cur["symbol"]):
+            venues[r["source"]] = r
+    return book
+
+def funding_spreads(all_rates, k=None):
+    """Top-k cross-venue funding spreads: long the lowest-funding venue, short the highest.
+
+    One pass hash-joins every venue's rows on canonical symbol, then heapq picks the k
+    widest spreads without sorting the whole universe."""
+    book = _venue_book(all_rates)
+    def spreads():
+        for sym, venues in book.items():
+            if len(venues) > 1:
+                lo = min(venues.values(), key=lambda r: r["rate"])
+                hi = max(venues.values(), key=lambda r: r["rate"])
+                yield hi["rate"] - lo["rate"], sym, lo, hi, len(venues)
+    top = heapq.nlargest(k or FUNDING_SPREADS_TOP, spreads(), key=lambda x: x[0])
+    return [{"symbol": sym, "long": lo["source"], "short": hi["source"],
+             "long_rate_8h": round(lo["rate"]*100, 4), "short_rate_8h": round(hi["rate"]*100, 4),
+             "spread_8h": round(spread*100, 4), "spread_ann": round(spread*3*365*100, 1), "venues": n}
+            for spread, sym, lo, hi, n in top]
+
+FUNDING_EXCHANGES = [("Binance", _fetch_binance), ("Bybit", _fetch_bybit), ("Gate.io", _fetch_gateio)]
+FUNDING_BREAKERS = {"Binance": "binance", "Bybit": "bybit", "Gate.io": "gateio"}
+FUNDING_PARALLEL = os.environ.get("FUNDING_PARALLEL", "1") == "1"
+FUNDING_DEADLINE = float(os.environ.get("FUNDING_DEADLINE", "12"))
+_fanout_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="fanout")
+
+def _timed(fn):
+    t0 = time.perf_counter()
+    rows = fn()
+    return rows, round((time.perf_counter() - t0) * 1000)
+
+def _fetch_funding_rates(parallel):
+    """Return {exchange: (rows, ms)}; exchanges missing the FUNDING_DEADLINE map to None.
+
+    In parallel mode all venues are queried at once on the shared fan-out pool, so the
+    refresh waits for the slowest venue (at most the deadline) rather than their sum."""
+    if not parallel:
+        return {name: _timed(fn) for name, fn in FUNDING_EXCHANGES}
+    futures = {name: _fanout_pool.submit(_timed, fn) for name, fn in FUNDING_EXCHANGES}
+    done, _ = wait(futures.values(), timeout=FUNDING_DEADLINE)
+    return {name: (fut.result() if fut in done else None) for name, fut in futures.items()}
+
+def fetch_funding(parallel=None):
     try:
         all_rates = []
+        live = []  # rows fetched this run; a stale venue's last good rows are shown but not recorded or paired
         sources = []
-        for name, fn in [("Binance", _fetch_binance), ("Bybit", _fetch_bybit), ("Gate.io", _fetch_gateio)]:
-            d = fn()
+        exchanges = {}
+        fetched = _fetch_funding_rates(FUNDING_PARALLEL if parallel is None else parallel)
+        for name, _ in FUNDING_EXCHANGES:
+            if fetched[name] is None:
+                exchanges[name] = {"status": "timeout", "count": 0, "ms": None}
+                continue
+            d, ms = fetched[name]
+            b = breakers[FUNDING_BREAKERS[name]]
+            exchanges[name] = {"status": "stale" if d and b.stale else "ok" if d else "empty", "count": len(d),
+                               "ms": ms, "stale": b.stale, "breaker": b.state,
+                               "error": b.last_error if not d or b.stale else None}
             if d:
                 all_rates.extend(d)
                 sources.append(name)
-        seen = {}
-        for r in all_rates:
-            sym = r["symbol"].replace("USDT", "").replace("BUSD", "").replace("USD", "")
-            if sym not in seen: seen[sym] = r
-        deduped = list(seen.values())
-        deduped.sort(key=lambda x: -x["rate"])
+                if not b.stale:
+                    live.extend(d)
+        history_error = None
+        try:
+            funding_history.record(time.time(), live)
+        except Exception as e:  # the history is a side record; never lose the live rates over it
+            history_error = f"{type(e).__name__}: {e}"
+        deduped = [next(iter(venues.values())) for venues in _venue_book(all_rates).values()]
         def fmt(r):
             ann = r["rate"] * 3 * 365 * 100
             return {"symbol": r["symbol"], "rate_8h": round(r["rate"]*100, 4),
                     "annualized": round(ann, 1), "source": r["source"]}
-        top_long = [fmt(r) for r in deduped[:10]]
-        top_short = [fmt(r) for r in deduped[-10:][::-1]]
+        top_long = [fmt(r) for r in heapq.nlargest(10, deduped, key=lambda x: x["rate"])]
+        top_short = [fmt(r) for r in heapq.nsmallest(10, deduped, key=lambda x: x["rate"])]
         avg = sum(r["rate"] for r in deduped) / len(deduped) if deduped else 0
-        return {"top_positive": top_long, "top_negative": top_short,
-                "total": len(deduped), "sources": sources,
+        return {"top_positive": top_long, "top_negative": top_short, "spreads": funding_spreads(live),
+                "total": len(deduped), "sources": sources, "exchanges": exchanges, "history_error": history_error,
                 "avg_rate": round(avg*100, 4), "avg_ann": round(avg*3*365*100, 1)}
     except Exception as e:
         return {"error": str(e)}
 
 
+# ═══════════════════════════════════════════════════════════════════
+# DATA — FUNDING HISTORY
+# ═══════════════════════════════════════════════════════════════════
+
+FUNDING_HISTORY_CAP = int(os.environ.get("FUNDING_HISTORY_CAP", "8192"))
+# One point per funding period (the latest reading in it), not per refresh: at the
+# default 8h that is ~7 years of history per series, whatever the refresh interval.
+FUNDING_HISTORY_STEP = int(os.environ.get("FUNDING_HISTORY_STEP", str(8 * 3600)))
+# Worker processes sharing a cache share the history too: it lives next to the cache DB.
+FUNDING_HISTORY_DIR = os.environ.get("FUNDING_HISTORY_DIR") or \
+    (os.environ["SHARED_CACHE_DB"] + ".funding" if os.environ.get("SHARED_CACHE_DB") else "")
+_HIST_HEADER = 16  # two uint64s: head, count
+
+class FundingSeries:
+    """Fixed-capacity ring buffer of (epoch seconds, 8h rate) for one symbol on one exchange.
+
+    Columns are flat `array` columns (uint32 timestamps, float32 rates) that grow up to
+    `cap` and then wrap, or memoryviews over a file when a path is given. The file is
+    mapped only for the duration of one append or range call, so thousands of series
+    never hold a descriptor each. Points arrive in time order, so range queries are
+    binary searches. A mapped file may be appended to by another process (the cluster
+    leader), so head/count are re-read from its header on every call."""
+
+    def __init__(self, cap, path=None):
+        self.cap, self.path = cap, path
+        self.head = self.count = 0
+        if path is None:
+            self.ts, self.rate = array("I"), array("f")
+            return
+        size = _HIST_HEADER + 8 * cap
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if not path.exists() or path.stat().st_size != size:  # new file or capacity changed
+            with open(path, "wb") as f:
+                f.truncate(size)  # zero header: empty series
+
+    @contextlib.contextmanager
+    def _mapped(self):
+        if self.path is None:
+            yield
+            return
+        with open(self.path, "r+b") as f:
+            mm = mmap.mmap(f.fileno(), _HIST_HEADER + 8 * self.cap)
+        views = (memoryview(mm)[:_HIST_HEADER].cast("Q"),
+                 memoryview(mm)[_HIST_HEADER:_HIST_HEADER + 4 * self.cap].cast("I"),
+                 memoryview(mm)[_HIST_HEADER + 4 * self.cap:].cast("f"))
+        self._hdr, self.ts, self.rate = views
+        self.head, self.count = self._hdr[0], self._hdr[1]
+        try:
+            yield
+        finally:
+            self._hdr = self.ts = self.rate = None
+            for v in views:
+                v.release()
+            mm.close()
+
+    def append(self, ts, rate):
+        with self._mapped():
+            self._append(ts, rate)
+
+    def _append(self, ts, rate):
+        if self.count:
+            last = self._at(self.count - 1, self.head)[0]
+            if ts <= last:
+                return  # out-of-order or duplicate refresh
+            if last // FUNDING_HISTORY_STEP == int(ts) // FUNDING_HISTORY_STEP:
+                pos = (self.head + self.count - 1) % self.cap
+                self.ts[pos], self.rate[pos] = int(ts), rate  # same period: keep its latest reading
+                return
+        if self.path is None and self.count < self.cap:
+            self.ts.append(int(ts)); self.rate.append(rate)
+            self.count += 1
+            return
+        if self.count < self.cap:
+            pos = self.count
+            self.count += 1
+        else:
+            pos = self.head
+            self.head = (self.head + 1) % self.cap
+        self.ts[pos], self.rate[pos] = int(ts), rate
+        if self.path is not None:
+            self._hdr[0], self._hdr[1] = self.head, self.count
+
+    def _at(self, k, head):
+        pos = (head + k) % self.cap
+        return self.ts[pos], self.rate[pos]
+
+    def _bisect(self, ts, head, count):
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.ts[(head + mid) % self.cap] < ts: lo = mid + 1
+            else: hi = mid
+        return lo
+
+    def range(self, start=None, end=None, limit=None):
+        """Points with start <= ts <= end, oldest first; `limit` keeps the newest ones."""
+        with self._mapped():
+            head, count = self.head, self.count
+            lo = self._bisect(start, head, count) if start is not None else 0
+            hi = self._bisect(end + 1, head, count) if end is not None else count
+            if limit is not None:
+                lo = max(lo, hi - limit)
+            return [self._at(k, head) for k in range(lo, hi)]
+
+class FundingHistory:
+    """Per (exchange, symbol) FundingSeries, memory-mapped under FUNDING_HISTORY_DIR when set."""
+
+    def __init__(self, cap=FUNDING_HISTORY_CAP, root=FUNDING_HISTORY_DIR):
+        self.cap = cap
+        self.root = Path(root) if root else None
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def _path(self, exchange, symbol):
+        safe = lambda s: re.sub(r"[^A-Za-z0-9._-]", "_", s)
+        return self.root / safe(exchange) / f"{safe(symbol)}.bin"
+
+    def _get(self, exchange, symbol, create):
+        key = (exchange, symbol)
+        s = self.series.get(key)
+        if s is None and self.root is not None and (create or self._path(*key).exists()):
+            s = self.series[key] = FundingSeries(self.cap, self._path(*key))
+        elif s is None and create:
+            s = self.series[key] = FundingSeries(self.cap)
+        return s
+
+    def record(self, ts, rows):
+        with self.lock:
+            for sym, venues in _venue_book(rows).items():
+                for source, r in venues.items():
+                    self._get(source, sym, True).append(ts, r["rate"])
+
+    def exchanges_for(self, symbol):
+        with self.lock:
+            known = {ex for ex, sym in self.series if sym == symbol}
+        if self.root is not None and self.root.exists():
+            known.update(d.name for d in self.root.iterdir() if (d / f"{symbol}.bin").exists())
+        return sorted(known)
+
+    def query(self, exchange, symbol, start=None, end=None, limit=None):
+        with self.lock:
+            s = self._get(exchange, symbol, False)
+            return s.range(start, end, limit) if s else None
+
+funding_history = FundingHistory()
+
+
 # ═══════════════════════════════════════════════════════════════════
 # DATA — OPS COST MONITOR
 # ═══════════════════════════════════════════════════════════════════
@@ -270,6 +1187,631 @@ def compute_ops_data():
     }
 
 
+# ═══════════════════════════════════════════════════════════════════
+# DATA — BOOK STORAGE
+# ═══════════════════════════════════════════════════════════════════
+# Each paper-trading book is a compact JSON snapshot (the existing /tmp file) plus an
+# append-only JSONL log of mutations next to it. A trade is one appended line; the log
+# is replayed over the snapshot at load and folded into a new snapshot in the background
+# once it passes BOOK_COMPACT_BYTES. Records carry a sequence number and the snapshot
+# stores the last one it includes, so a crash mid-compaction never replays a record twice.
+# Several worker processes may share the files: appends, rotation and the seq counter
+# run under a flock on <book>.lock, and each process reopens the log when it was rotated.
+try:
+    import fcntl
+except ImportError:  # no flock on this platform: run one process per book file, or set BOOK_DB
+    fcntl = None
+
+BOOK_COMPACT_BYTES = int(os.environ.get("BOOK_COMPACT_BYTES", str(256 * 1024)))
+BOOK_DB = os.environ.get("BOOK_DB", "")  # if set, books live in this SQLite file instead
+
+class _Book:
+    """In-memory side shared by both stores.
+
+    `cache` is (data, stamp): a read-only view of the whole book plus the cheap stamp it
+    was read at (file mtime/size, or the SQLite seq). view() hands it out while the stamp
+    still matches; our own mutations are applied to a copy of it (write-behind: the
+    durable write goes to the log, the new view is built in memory, no re-read). Ops never
+    modify a trade row in place, so only the positions need copying. summary() memoizes
+    compute_* results per view.
+
+    Along one line of views trades are only appended or replaced in their slot, so a single
+    id -> slots index serves every view on it and only grows at the tail; it is dropped
+    whenever the view is re-read from storage instead of advanced."""
+
+    def __init__(self):
+        self.cache = None
+        self.summaries = {}
+        self.index_lock = threading.Lock()
+        self.trade_index, self.indexed = {}, 0
+
+    def _forget_index(self):
+        with self.index_lock:
+            self.trade_index, self.indexed = {}, 0
+
+    @staticmethod
+    def working_copy(data):
+        """A copy of a view that the ops may mutate without disturbing readers of the original."""
+        data = dict(data)
+        if "positions" in data:
+            data["positions"] = [dict(p) for p in data["positions"]]
+        if "trades" in data:
+            data["trades"] = list(data["trades"])
+        return data
+
+    def _advance(self, before, stamp, records, data=None):
+        """After logging `records`: swap in the view they produce if ours was current at
+        `before`. `data` is that view when the caller has already built it."""
+        cache = self.cache
+        if cache is None or cache[1] != before:
+            self.cache = None
+            self._forget_index()
+            return
+        if data is None:
+            data = self.working_copy(cache[0])
+            for op, args in records:
+                self.ops[op](data, *args)
+        self.cache = (data, stamp)
+
+    def append(self, op, *args):
+        return self.append_many([(op, args)])[0]
+
+    def load(self):
+        """A private, mutable copy of the book."""
+        return copy.deepcopy(self.view())
+
+    def summary(self, fn):
+        data = self.view()
+        hit = self.summaries.get(fn)
+        if hit is None or hit[0] is not data:
+            hit = self.summaries[fn] = (data, fn(data))
+        return hit[1]
+
+    def trade_slots(self, trade_id, data=None):
+        """Where trade `trade_id` sits in data["trades"] (a view, or the writer's working copy),
+        oldest first. Constant time once the index has caught up with the tail."""
+        if data is None:
+            data = self.view()
+        trades = data.get("trades", [])
+        key = str(trade_id)
+        with self.index_lock:
+            index = self.trade_index
+            for i in range(self.indexed, len(trades)):
+                index.setdefault(_trade_key(i, trades[i]), []).append(i)
+            self.indexed = max(self.indexed, len(trades))
+            slots = [i for i in index.get(key, ()) if i < len(trades)]
+        if any(_trade_key(i, trades[i]) != key for i in slots):
+            self._forget_index()  # not a view on our line (e.g. a working copy that was dropped)
+            slots = [i for i, t in enumerate(trades) if _trade_key(i, t) == key]
+        return slots
+
+    def find_trade(self, trade_id, data=None):
+        if data is None:
+            data = self.view()
+        slots = self.trade_slots(trade_id, data)
+        return data["trades"][slots[0]] if slots else None
+
+def _trade_key(i, t):
+    """A trade's id as the journal addresses it; trades logged without one go by list position."""
+    return str(t.get("id", i))
+
+def _next_trade_id(data):
+    """The id for the book's next trade. Kept in the book as next_trade_id and advanced by
+    every trade op, so ids stay unique across restarts and after trades are deleted."""
+    nxt = data.get("next_trade_id")
+    if nxt is None:  # book from before the counter: start past every id and list position in use
+        trades = data.get("trades", [])
+        nxt = max([len(trades)] + [t["id"] for t in trades if type(t.get("id")) is int]) + 1
+    return nxt
+
+def _add_trade(data, trade):
+    """Trade-op helper: append `trade`, numbering it from the counter if it has no id, and
+    move the counter past its id. Ops run where the write is serialized (the SQLite
+    transaction, or the JSON log's flock), so concurrent processes never share an id."""
+    if "id" not in trade:
+        trade = {**trade, "id": _next_trade_id(data)}
+    data.setdefault("trades", []).append(trade)
+    if type(trade["id"]) is int:
+        data["next_trade_id"] = max(_next_trade_id(data), trade["id"] + 1)
+    return trade
+
+def _last_newline(f, pos=None):
+    """Offset just past the last newline in binary file `f` before `pos` (default: its end), or 0."""
+    if pos is None:
+        pos = f.seek(0, os.SEEK_END)
+    while pos > 0:
+        step = min(pos, 4096)
+        f.seek(pos - step)
+        nl = f.read(step).rfind(b"\n")
+        if nl >= 0:
+            return pos - step + nl + 1
+        pos -= step
+    return 0
+
+class BookStore(_Book):
+    def __init__(self, path, default, ops):
+        super().__init__()
+        self.path = path
+        self.log_path = path.with_name(path.name + ".log")
+        self.old_log_path = path.with_name(path.name + ".log.1")  # log being folded by compaction
+        self.default, self.ops = default, ops
+        self.lock = threading.Lock()          # log file, sequence numbers, snapshot swaps
+        self.sync_lock = threading.Lock()     # one fsync at a time; waiting writers share it
+        self.compact_lock = threading.Lock()  # one snapshot rewrite at a time
+        self.lock_path = path.with_name(path.name + ".lock")
+        self.lock_file = None
+        self.seq = None
+        self.synced = 0
+        self.log = None
+        self.log_size = None  # log size after our last write; anything else means another process appended
+        self.compacting = False
+
+    def _read_snapshot(self):
+        try:
+            return json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            data = self.default()
+            self._write_snapshot(data, 0)
+            return data
+
+    def _write_snapshot(self, data, seq):
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump({**data, "_seq": seq}, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def _records(self, path):
+        try:
+            f = open(path)
+        except FileNotFoundError:
+            return
+        with f:
+            for line in f:
+                if not line.endswith("\n"):
+                    return  # torn tail from a crash mid-append
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue  # damaged line; the records after it are still good
+
+    def _open_log(self):
+        """Open the log for appending, first cutting a torn tail back to the last newline
+        so the next record starts on a line of its own."""
+        try:
+            with open(self.log_path, "r+b") as f:
+                end = f.seek(0, os.SEEK_END)
+                keep = _last_newline(f)
+                if keep < end:
+                    f.truncate(keep)
+        except FileNotFoundError:
+            pass
+        return open(self.log_path, "a")
+
+    def _replay(self, paths):
+        data = self._read_snapshot()
+        base = last = data.pop("_seq", 0)
+        for path in paths:
+            for rec in self._records(path):
+                if rec["seq"] > base:
+                    self.ops[rec["op"]](data, *rec["args"])
+                    last = rec["seq"]
+        return data, last
+
+    def _stamp(self):
+        stamp = []
+        for path in (self.path, self.old_log_path, self.log_path):
+            try:
+                st = os.stat(path)
+                stamp.append((st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    def view(self):
+        """The book, shared and read-only. Costs three stat() calls unless the files changed."""
+        cache = self.cache
+        if cache is not None and cache[1] == self._stamp():
+            return cache[0]
+        with self.lock, self._flock():
+            stamp = self._stamp()
+            data, _ = self._replay((self.old_log_path, self.log_path))
+            self.cache = (data, stamp)
+        self._forget_index()
+        return data
+
+    def _restamp(self, before):
+        """Files changed without changing the book (compaction): keep the view if it was current."""
+        if self.cache is not None and self.cache[1] == before:
+            self.cache = (self.cache[0], self._stamp())
+
+    @contextlib.contextmanager
+    def _flock(self):
+        """Exclusive across processes: the log, its rotation, the snapshot and the seq counter.
+        Taken inside self.lock (flock does not exclude threads sharing the file)."""
+        if fcntl is None:
+            yield
+            return
+        if self.lock_file is None:
+            self.lock_file = open(self.lock_path, "a")
+        fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+
+    def _attach(self):
+        """Under _flock: catch up with other processes sharing the files. Reopen the log if it
+        was rotated or removed under us, and re-read the last seq if anyone else appended."""
+        try:
+            ino = os.stat(self.log_path).st_ino
+        except FileNotFoundError:
+            ino = None
+        if self.log is not None and os.fstat(self.log.fileno()).st_ino != ino:
+            os.fsync(self.log.fileno())  # our records in it are durable before we let go
+            self.synced = self.seq
+            self.log.close()
+            self.log = None
+        if self.log is None:
+            self.log, self.log_size = self._open_log(), None
+        size = os.fstat(self.log.fileno()).st_size
+        if self.seq is None or size != self.log_size:
+            last = self._last_seq()
+            if self.seq is None:
+                self.synced = last
+            self.seq, self.log_size = last, size
+
+    def _last_seq(self):
+        """Seq of the newest record: the log's last line, else the rotated log's, else the snapshot's."""
+        for path in (self.log_path, self.old_log_path):
+            try:
+                f = open(path, "rb")
+            except FileNotFoundError:
+                continue
+            with f:
+                end = _last_newline(f)
+                while end:
+                    start = _last_newline(f, end - 1)
+                    f.seek(start)
+                    try:
+                        return json.loads(f.read(end - start))["seq"]
+                    except ValueError:
+                        end = start
+        return self._read_snapshot().get("_seq", 0)
+
+    def append_many(self, records, data=None, results=None):
+        """Log (op, args) mutations with one write and return the ops' results once they are
+        on disk. `data` and `results` are what the records made of the current view, if the
+        caller already applied them; when another process wrote since that view, they are
+        redone here against the book as it now is, before anything is logged.
+        O(1) in the size of the book unless that happens."""
+        with self.lock, self._flock():
+            self._attach()
+            before = self._stamp()
+            if data is None or self.cache is None or self.cache[1] != before:
+                if self.cache is None or self.cache[1] != before:
+                    self.cache = (self._replay((self.old_log_path, self.log_path))[0], before)
+                    self._forget_index()
+                data = self.working_copy(self.cache[0])
+                results = [self.ops[op](data, *args) for op, args in records]
+            lines = []
+            for op, args in records:
+                self.seq += 1
+                lines.append(json.dumps({"seq": self.seq, "op": op, "args": args}, separators=(",", ":")) + "\n")
+            seq = self.seq
+            self.log.write("".join(lines))
+            self.log.flush()
+            self.log_size = os.fstat(self.log.fileno()).st_size
+            self._advance(before, self._stamp(), records, data)
+            big = self.log_size > BOOK_COMPACT_BYTES and not self.compacting
+            if big:
+                self.compacting = True
+        self._sync(seq)
+        if big:
+            threading.Thread(target=self.compact, daemon=True).start()
+        return results
+
+    def _sync(self, seq):
+        # Group commit: whoever holds sync_lock fsyncs everything written so far,
+        # so writers that queued behind it usually find their record already durable.
+        with self.sync_lock:
+            if self.synced >= seq:
+                return
+            with self.lock:
+                upto, fd = self.seq, os.dup(self.log.fileno())
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            self.synced = upto
+
+    def compact(self):
+        """Fold the log into a new snapshot. Writers only wait for the log rotation.
+        Another process may rotate or fold first; the fold only lands if the rotated log
+        it read is still the one on disk."""
+        try:
+            with self.compact_lock:
+                with self.sync_lock, self.lock, self._flock():
+                    if not self.old_log_path.exists():
+                        self._attach()
+                        before = self._stamp()
+                        os.fsync(self.log.fileno())
+                        self.synced = self.seq
+                        self.log.close()
+                        self.log, self.log_size = None, None
+                        os.replace(self.log_path, self.old_log_path)
+                        self._restamp(before)
+                    try:
+                        ino = os.stat(self.old_log_path).st_ino
+                    except FileNotFoundError:
+                        return
+                data, last = self._replay((self.old_log_path,))
+                with self.lock, self._flock():
+                    try:
+                        current = os.stat(self.old_log_path).st_ino == ino
+                    except FileNotFoundError:
+                        current = False
+                    if current:
+                        before = self._stamp()
+                        self._write_snapshot(data, last)
+                        self.old_log_path.unlink()
+                        self._restamp(before)
+        finally:
+            self.compacting = False
+
+    def save(self, data):
+        """Replace the whole book (snapshot rewrite; the log is emptied)."""
+        with self.compact_lock, self.sync_lock, self.lock, self._flock():
+            self._attach()
+            self._write_snapshot(data, self.seq)
+            self.synced = self.seq
+            self.log.close()
+            self.log, self.log_size = None, None
+            self.log_path.unlink(missing_ok=True)
+            self.old_log_path.unlink(missing_ok=True)
+            self.cache = None
+
+# ─── SQLite backend ─────────────────────────────────────────────────
+# With BOOK_DB set, all four books share one SQLite file in WAL mode: the book's
+# scalar fields as a JSON row, positions and trades as rows keyed by book and order
+# (trades also indexed by id, for the exit op). Mutations run the same op functions
+# inside BEGIN IMMEDIATE over just the rows they touch, so concurrent writers (threads
+# or processes) serialize instead of overwriting each other. Reads are served from the
+# in-memory view (_Book), re-read only when the book's seq moves. A book missing from
+# the database is migrated from its JSON snapshot + log on first use; the JSON files
+# are left alone.
+_book_local = threading.local()
+
+def _book_db():
+    conn = getattr(_book_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(BOOK_DB, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS books (name TEXT PRIMARY KEY, meta TEXT NOT NULL, seq INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS positions (book TEXT NOT NULL, ord INTEGER NOT NULL, pos_id TEXT,
+                strategy TEXT, status TEXT, data TEXT NOT NULL, PRIMARY KEY (book, ord));
+            CREATE TABLE IF NOT EXISTS trades (book TEXT NOT NULL, ord INTEGER NOT NULL, trade_id TEXT,
+                status TEXT, timestamp TEXT, exit_timestamp TEXT, data TEXT NOT NULL, PRIMARY KEY (book, ord));
+            CREATE INDEX IF NOT EXISTS trades_by_id ON trades (book, trade_id);
+            DROP INDEX IF EXISTS positions_by_status;
+            DROP INDEX IF EXISTS trades_by_status;
+            DROP INDEX IF EXISTS trades_by_time;
+        """)
+        _book_local.conn = conn
+    return conn
+
+class SqliteBookStore(_Book):
+    TRADE_ID_OPS = {"exit"}  # ops whose first argument is the id of the one trade they change
+
+    def __init__(self, name, path, default, ops):
+        super().__init__()
+        self.name, self.path, self.default, self.ops = name, path, default, ops
+        self.migrated = False
+
+    def _tx(self, fn, write=False):
+        db = _book_db()
+        if not self.migrated:
+            self._migrate(db)
+        db.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+        try:
+            result = fn(db)
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+        return result
+
+    def _migrate(self, db):
+        if db.execute("SELECT 1 FROM books WHERE name = ?", (self.name,)).fetchone() is None:
+            data = BookStore(self.path, self.default, self.ops).load() if self.path.exists() else self.default()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                if db.execute("SELECT 1 FROM books WHERE name = ?", (self.name,)).fetchone() is None:
+                    self._write(db, data, 1)
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+        self.migrated = True
+
+    def _position_row(self, ord, p):
+        pid = p.get("id")
+        return (self.name, ord, None if pid is None else str(pid), p.get("strategy"), p.get("status"), json.dumps(p))
+
+    def _trade_row(self, ord, t):
+        tid = t.get("id")
+        return (self.name, ord, None if tid is None else str(tid), t.get("status"), t.get("timestamp"),
+                t.get("exit_timestamp"), json.dumps(t))
+
+    def _write(self, db, data, seq):
+        meta = {k: v for k, v in data.items() if k not in ("positions", "trades")}
+        db.execute("INSERT OR REPLACE INTO books (name, meta, seq) VALUES (?, ?, ?)", (self.name, json.dumps(meta), seq))
+        db.execute("DELETE FROM positions WHERE book = ?", (self.name,))
+        db.execute("DELETE FROM trades WHERE book = ?", (self.name,))
+        db.executemany("INSERT INTO positions VALUES (?, ?, ?, ?, ?, ?)",
+                       [self._position_row(i, p) for i, p in enumerate(data.get("positions", []))])
+        db.executemany("INSERT INTO trades VALUES (?, ?, ?, ?, ?, ?, ?)",
+                       [self._trade_row(i, t) for i, t in enumerate(data.get("trades", []))])
+
+    def _seq(self, db):
+        return db.execute("SELECT seq FROM books WHERE name = ?", (self.name,)).fetchone()[0]
+
+    def view(self):
+        """The book, shared and read-only. Revalidated with one indexed read of the book's seq."""
+        cache = self.cache
+        if cache is not None and cache[1] == self._tx(self._seq):
+            return cache[0]
+        def read(db):
+            meta, seq = db.execute("SELECT meta, seq FROM books WHERE name = ?", (self.name,)).fetchone()
+            data = json.loads(meta)
+            data["positions"] = [json.loads(d) for (d,) in
+                                 db.execute("SELECT data FROM positions WHERE book = ? ORDER BY ord", (self.name,))]
+            data["trades"] = [json.loads(d) for (d,) in
+                              db.execute("SELECT data FROM trades WHERE book = ? ORDER BY ord", (self.name,))]
+            return data, seq
+        data, seq = self._tx(read)
+        self.cache = (data, seq)
+        self._forget_index()
+        return data
+
+    def _apply_row_op(self, db, op, args):
+        """Run one op over just the rows it touches and write back what changed."""
+        meta = json.loads(db.execute("SELECT meta FROM books WHERE name = ?", (self.name,)).fetchone()[0])
+        if "next_trade_id" not in meta:  # the ops only see the rows below, so seed it from the table
+            count, top = db.execute("SELECT COUNT(*), COALESCE(MAX(CAST(trade_id AS INTEGER)), 0)"
+                                    " FROM trades WHERE book = ?", (self.name,)).fetchone()
+            meta["next_trade_id"] = max(count, top) + 1
+        positions = db.execute("SELECT ord, data FROM positions WHERE book = ? ORDER BY ord", (self.name,)).fetchall()
+        trades = []
+        if op in self.TRADE_ID_OPS:
+            trades = db.execute("SELECT ord, data FROM trades WHERE book = ? AND trade_id = ? ORDER BY ord",
+                                (self.name, str(args[0]))).fetchall()
+        data = {**meta, "positions": [json.loads(d) for _, d in positions],
+                "trades": [json.loads(d) for _, d in trades]}
+        result = self.ops[op](data, *args)
+        if data["next_trade_id"] != meta["next_trade_id"]:
+            meta["next_trade_id"] = data["next_trade_id"]
+            db.execute("UPDATE books SET meta = ? WHERE name = ?", (json.dumps(meta), self.name))
+        for (ord, old), p in zip(positions, data["positions"]):
+            if json.dumps(p) != old:
+                db.execute("UPDATE positions SET pos_id = ?, strategy = ?, status = ?, data = ? WHERE book = ? AND ord = ?",
+                           self._position_row(ord, p)[2:] + (self.name, ord))
+        for (ord, old), t in zip(trades, data["trades"]):
+            if json.dumps(t) != old:
+                db.execute("UPDATE trades SET trade_id = ?, status = ?, timestamp = ?, exit_timestamp = ?, data = ?"
+                           " WHERE book = ? AND ord = ?", self._trade_row(ord, t)[2:] + (self.name, ord))
+        added = data["trades"][len(trades):]
+        if added:
+            (top,) = db.execute("SELECT COALESCE(MAX(ord), -1) FROM trades WHERE book = ?", (self.name,)).fetchone()
+            db.executemany("INSERT INTO trades VALUES (?, ?, ?, ?, ?, ?, ?)",
+                           [self._trade_row(top + 1 + i, t) for i, t in enumerate(added)])
+        return result
+
+    def append_many(self, records, data=None, results=None):
+        """Apply (op, args) mutations in one transaction and return the ops' results, as
+        computed inside it (ids come from the meta row's counter, not from our view)."""
+        def mutate(db):
+            before = self._seq(db)
+            results = [self._apply_row_op(db, op, args) for op, args in records]
+            db.execute("UPDATE books SET seq = seq + 1 WHERE name = ?", (self.name,))
+            return before, results
+        before, results = self._tx(mutate, write=True)
+        self._advance(before, before + 1, records, data)
+        return results
+
+    def save(self, data):
+        self._tx(lambda db: self._write(db, data, self._seq(db) + 1), write=True)
+        self.cache = None
+        self._forget_index()
+
+def _open_book(name, path, default, ops):
+    return SqliteBookStore(name, path, default, ops) if BOOK_DB else BookStore(path, default, ops)
+
+# ─── Book writers ───────────────────────────────────────────────────
+BOOK_BATCH_MAX = int(os.environ.get("BOOK_BATCH_MAX", "256"))
+
+class BookWriter:
+    """The single writer of one book.
+
+    Mutations queue up and are prepared in arrival order against the book as every
+    earlier mutation left it, so checks and id assignment never race. Each drained batch
+    is committed with one append_many (one log write + fsync, or one transaction)."""
+
+    def __init__(self, book):
+        self.book = book
+        self.queue = queue.Queue()
+        self.thread = None
+        self.start_lock = threading.Lock()
+
+    def submit(self, prepare):
+        """Queue prepare(data) -> (ack, records) and return `ack` once `records`
+        ((op, args) pairs) are durable. A callable ack is called with the committed ops'
+        results first. Exceptions from prepare, the ops or the commit re-raise here."""
+        if self.thread is None:
+            with self.start_lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._run, daemon=True, name="book-writer")
+                    self.thread.start()
+        fut = Future()
+        self.queue.put((prepare, fut))
+        return fut.result()
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < BOOK_BATCH_MAX:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._commit(batch)
+            except Exception as e:
+                self.book._forget_index()  # it may hold slots of trades that never landed
+                for item in batch:
+                    if item[1].done():
+                        continue
+                    if len(batch) == 1:
+                        item[1].set_exception(e)
+                        continue
+                    try:  # one bad mutation must not fail the rest of its batch
+                        self._commit([item])
+                    except Exception as e1:
+                        self.book._forget_index()
+                        item[1].set_exception(e1)
+
+    def _commit(self, batch):
+        view = self.book.view()
+        data = self.book.working_copy(view)
+        records, results, acks = [], [], []
+        for prepare, fut in batch:
+            try:
+                ack, recs = prepare(data)
+                res = [self.book.ops[op](data, *args) for op, args in recs]
+            except Exception as e:
+                fut.set_exception(e)
+                data = self.book.working_copy(view)  # drop its partial effects
+                for op, args in records:
+                    self.book.ops[op](data, *args)
+                continue
+            acks.append((fut, ack, len(records), len(recs)))
+            records.extend(recs)
+            results.extend(res)
+        if records:
+            results = self.book.append_many(records, data, results)
+        for fut, ack, start, n in acks:
+            fut.set_result(ack(results[start:start + n]) if callable(ack) else ack)
+
+def _trade_ack(results):
+    return {"ok": True, "trade_id": results[0]["id"]}
+
+def _trade_mutation(trade):
+    """Log a trade; the op numbers it if the caller did not."""
+    return lambda data: (_trade_ack, [("trade", (trade,))])
+
+
 # ═══════════════════════════════════════════════════════════════════
 # DATA — PORTFOLIO (Paper Trading)
 # ═══════════════════════════════════════════════════════════════════
@@ -292,23 +1834,41 @@ def _default_portfolio():
         "created": now,
     }
 
+def _apply_portfolio_trade(data, trade):
+    trade = _add_trade(data, trade)
+    # Update positions if provided
+    if "strategy" in trade and "new_value" in trade:
+        for p in data["positions"]:
+            if p["strategy"] == trade["strategy"]:
+                p["current_value"] = float(trade["new_value"])
+                p["pnl"] = round(p["current_value"] - p["entry_price"], 2)
+                p["status"] = trade.get("status", p["status"])
+    return trade
+
+def _apply_position_trade(data, trade):
+    """Trade op shared by the crypto and ETF books (positions keyed by id)."""
+    trade = _add_trade(data, trade)
+    if "position_id" in trade and "new_value" in trade:
+        for p in data.get("positions", []):
+            if p.get("id") == trade["position_id"]:
+                p["current_value"] = float(trade["new_value"])
+                p["pnl"] = round(p["current_value"] - p.get("cost_basis", 0), 2)
+                p["status"] = trade.get("status", p.get("status", "open"))
+    return trade
+
+portfolio_book = _open_book("portfolio", PORTFOLIO_FILE, _default_portfolio, {"trade": _apply_portfolio_trade})
+portfolio_writer = BookWriter(portfolio_book)
+
 def load_portfolio():
-    if not PORTFOLIO_FILE.exists():
-        data = _default_portfolio()
-        PORTFOLIO_FILE.write_text(json.dumps(data, indent=2))
-        return data
-    try:
-        return json.loads(PORTFOLIO_FILE.read_text())
-    except:
-        data = _default_portfolio()
-        PORTFOLIO_FILE.write_text(json.dumps(data, indent=2))
-        return data
+    return portfolio_book.load()
 
 def save_portfolio(data):
-    PORTFOLIO_FILE.write_text(json.dumps(data, indent=2))
+    portfolio_book.save(data)
 
 def compute_portfolio():
-    data = load_portfolio()
+    return portfolio_book.summary(_summarize_portfolio)
+
+def _summarize_portfolio(data):
     total_value = sum(p["current_value"] for p in data["positions"])
     total_pnl = total_value - data["starting_capital"]
     return {
@@ -343,23 +1903,19 @@ def _default_etf_portfolio():
         "created": now,
     }
 
+etf_book = _open_book("etf", ETF_PORTFOLIO_FILE, _default_etf_portfolio, {"trade": _apply_position_trade})
+etf_writer = BookWriter(etf_book)
+
 def load_etf_portfolio():
-    if not ETF_PORTFOLIO_FILE.exists():
-        data = _default_etf_portfolio()
-        ETF_PORTFOLIO_FILE.write_text(json.dumps(data, indent=2))
-        return data
-    try:
-        return json.loads(ETF_PORTFOLIO_FILE.read_text())
-    except:
-        data = _default_etf_portfolio()
-        ETF_PORTFOLIO_FILE.write_text(json.dumps(data, indent=2))
-        return data
+    return etf_book.load()
 
 def save_etf_portfolio(data):
-    ETF_PORTFOLIO_FILE.write_text(json.dumps(data, indent=2))
+    etf_book.save(data)
 
 def compute_etf_portfolio():
-    data = load_etf_portfolio()
+    return etf_book.summary(_summarize_etf_portfolio)
+
+def _summarize_etf_portfolio(data):
     total_value = sum(p.get("current_value", 0) for p in data.get("positions", []))
     if not total_value and data.get("positions"):
         total_value = data["starting_capital"]
@@ -397,23 +1953,19 @@ def _default_crypto_portfolio():
         "created": now,
     }
 
+crypto_book = _open_book("crypto", CRYPTO_PORTFOLIO_FILE, _default_crypto_portfolio, {"trade": _apply_position_trade})
+crypto_writer = BookWriter(crypto_book)
+
 def load_crypto_portfolio():
-    if not CRYPTO_PORTFOLIO_FILE.exists():
-        data = _default_crypto_portfolio()
-        CRYPTO_PORTFOLIO_FILE.write_text(json.dumps(data, indent=2))
-        return data
-    try:
-        return json.loads(CRYPTO_PORTFOLIO_FILE.read_text())
-    except:
-        data = _default_crypto_portfolio()
-        CRYPTO_PORTFOLIO_FILE.write_text(json.dumps(data, indent=2))
-        return data
+    return crypto_book.load()
 
 def save_crypto_portfolio(data):
-    CRYPTO_PORTFOLIO_FILE.write_text(json.dumps(data, indent=2))
+    crypto_book.save(data)
 
 def compute_crypto_portfolio():
-    data = load_crypto_portfolio()
+    return crypto_book.summary(_summarize_crypto_portfolio)
+
+def _summarize_crypto_portfolio(data):
     total_value = sum(p.get("current_value", 0) for p in data.get("positions", []))
     if not total_value and data.get("positions"):
         total_value = data["starting_capital"]
@@ -436,48 +1988,53 @@ def compute_crypto_portfolio():
 # DATA — NEWS & SIGNALS
 # ═══════════════════════════════════════════════════════════════════
 
-def fetch_news():
-    """Fetch financial news from Yahoo Finance RSS."""
+NEWS_URL = "https://feeds.finance.yahoo.com/rss/2.0/headline?s=^GSPC&region=US&lang=en-US"
+
+@upstream("yahoo_news")
+def _fetch_headlines():
     headlines = []
-    url = "https://feeds.finance.yahoo.com/rss/2.0/headline?s=^GSPC&region=US&lang=en-US"
     try:
-        try:
-            import feedparser
-            feed = feedparser.parse(url)
-            for entry in feed.entries[:20]:
-                pub = ""
-                if hasattr(entry, "published_parsed") and entry.published_parsed:
-                    pub = time.strftime("%Y-%m-%d %H:%M", entry.published_parsed)
-                headlines.append({
-                    "title": entry.get("title", ""),
-                    "link": entry.get("link", ""),
-                    "published": pub,
-                    "source": "Yahoo Finance",
-                })
-        except ImportError:
-            # Fallback: raw XML parsing
-            import xml.etree.ElementTree as ET
-            r = requests.get(url, timeout=10, headers=HEADERS)
-            if r.status_code == 200:
-                root = ET.fromstring(r.content)
-                for item in root.iter("item"):
-                    title = item.findtext("title", "")
-                    link = item.findtext("link", "")
-                    pub = item.findtext("pubDate", "")
-                    headlines.append({
-                        "title": title,
-                        "link": link,
-                        "published": pub[:16] if pub else "",
-                        "source": "Yahoo Finance",
-                    })
-                headlines = headlines[:20]
-    except Exception as e:
-        headlines = [{"title": f"Error fetching news: {e}", "link": "", "published": "", "source": "error"}]
+        import feedparser
+        feed = feedparser.parse(_expect_ok(http_get(NEWS_URL, timeout=10)).content)
+        for entry in feed.entries[:20]:
+            pub = ""
+            if hasattr(entry, "published_parsed") and entry.published_parsed:
+                pub = time.strftime("%Y-%m-%d %H:%M", entry.published_parsed)
+            headlines.append({
+                "title": entry.get("title", ""),
+                "link": entry.get("link", ""),
+                "published": pub,
+                "source": "Yahoo Finance",
+            })
+    except ImportError:
+        # Fallback: raw XML parsing
+        import xml.etree.ElementTree as ET
+        r = _expect_ok(http_get(NEWS_URL, timeout=10, headers=HEADERS))
+        root = ET.fromstring(r.content)
+        for item in root.iter("item"):
+            title = item.findtext("title", "")
+            link = item.findtext("link", "")
+            pub = item.findtext("pubDate", "")
+            headlines.append({
+                "title": title,
+                "link": link,
+                "published": pub[:16] if pub else "",
+                "source": "Yahoo Finance",
+            })
+        headlines = headlines[:20]
+    return headlines
+
+def fetch_news():
+    """Fetch financial news from Yahoo Finance RSS."""
+    headlines = _fetch_headlines()
+    b = breakers["yahoo_news"]
+    if not headlines and b.last_error:
+        return [{"title": f"Error fetching news: {b.last_error}", "link": "", "published": "", "source": "error"}]
     return headlines
 
 def fetch_signals():
     """Fetch polymarket data and compare with team views."""
-    poly = _fetch_polymarket()
+    poly = _fetch_polymarket(paginate=False)
     team_views = load_team_views()
     signals = []
     for m in poly[:30]:
@@ -526,23 +2083,40 @@ def _default_signals_book():
         "created": datetime.datetime.utcnow().strftime("%Y-%m-%d"),
     }
 
+def _apply_signals_trade(data, trade):
+    return _add_trade(data, trade)
+
+def _apply_signals_exit(data, trade_id, fields, slot=None):
+    """Close an open trade with the exit fields and return it; LookupError if there is no such open trade.
+    `slot` is where the writer found it, so replay need not search (older records have none)."""
+    trades = data.get("trades", [])
+    slots = range(len(trades))
+    if slot is not None and slot < len(trades) and trades[slot].get("id") == trade_id:
+        slots = (slot,)
+    for i in slots:
+        t = trades[i]
+        if t.get("id") == trade_id and t.get("status") == "open":
+            t = trades[i] = {**t, **fields}
+            multiplier = 1 if t["direction"] == "long" else -1
+            t["pnl"] = round((t["exit_price"] - t["entry_price"]) * t["size"] * multiplier, 2)
+            t["status"] = "closed"
+            return t
+    raise LookupError(f"no open trade {trade_id}")
+
+signals_book = _open_book("signals", SIGNALS_BOOK_FILE, _default_signals_book,
+                          {"trade": _apply_signals_trade, "exit": _apply_signals_exit})
+signals_writer = BookWriter(signals_book)
+
 def load_signals_book():
-    if not SIGNALS_BOOK_FILE.exists():
-        data = _default_signals_book()
-        SIGNALS_BOOK_FILE.write_text(json.dumps(data, indent=2))
-        return data
-    try:
-        return json.loads(SIGNALS_BOOK_FILE.read_text())
-    except:
-        data = _default_signals_book()
-        SIGNALS_BOOK_FILE.write_text(json.dumps(data, indent=2))
-        return data
+    return signals_book.load()
 
 def save_signals_book(data):
-    SIGNALS_BOOK_FILE.write_text(json.dumps(data, indent=2))
+    signals_book.save(data)
 
 def compute_signals_portfolio():
-    data = load_signals_book()
+    return signals_book.summary(_summarize_signals_portfolio)
+
+def _summarize_signals_portfolio(data):
     trades = data.get("trades", [])
     open_trades = [t for t in trades if t.get("status") == "open"]
     closed_trades = [t for t in trades if t.get("status") == "closed"]
@@ -631,44 +2205,612 @@ def compute_org():
     }
 
 
-# ─── Background refresh ─────────────────────────────────────────────
-def refresh():
+# ─── Refresh scheduler ──────────────────────────────────────────────
+# Every source has its own cadence and runs on a shared worker pool, so
+# slow upstreams never hold back the others and each cache entry is
+# published as soon as its own fetch completes.
+def _now_str(ts=None):
+    return datetime.datetime.utcfromtimestamp(time.time() if ts is None else ts).strftime("%Y-%m-%d %H:%M:%S UTC")
+
+# apply(current, result, updated) -> the section's next dict; `current` is never modified
+def _apply_trading(key):
+    def apply(current, value, updated):
+        # max: followers may pull the three trading sources out of order
+        return {**current, key: value, "updated": max(current.get("updated") or "", updated)}
+    return apply
+
+def _apply_news(current, headlines, updated):
+    return {"headlines": headlines, "updated": updated}
+
+def _apply_signals(current, markets, updated):
+    return {"markets": markets, "updated": updated}
+
+def _apply_merge(current, value, updated):
+    return {**current, **value}
+
+def _source(fetch, apply, interval, jitter, timeout, priority):
+    return {"fetch": fetch, "apply": apply, "interval": interval, "jitter": jitter,
+            "timeout": timeout, "priority": priority}
+
+# priority: lower runs first when several sources are due at once
+SOURCES = {
+    "funding": _source(fetch_funding, _apply_trading("funding"), 60, 5, 30, 0),
+    "arb":     _source(fetch_arb, _apply_trading("arb"), 300, 30, 120, 1),
+    "vix":     _source(fetch_vix, _apply_trading("vix"), 300, 15, 60, 1),
+    "signals": _source(fetch_signals, _apply_signals, 300, 30, 30, 2),
+    "news":    _source(fetch_news, _apply_news, 300, 30, 30, 3),
+    "ops":     _source(compute_ops_data, _apply_merge, 60, 5, 15, 3),
+    "org":     _source(compute_org, _apply_merge, 1800, 60, 15, 4),
+}
+for _name, _src in SOURCES.items():
+    _src["interval"] = float(os.environ.get(f"REFRESH_{_name.upper()}_INTERVAL", _src["interval"]))
+
+SCHEDULER_WORKERS = int(os.environ.get("SCHEDULER_WORKERS", str(len(SOURCES) + 2)))
+_scheduler_pool = ThreadPoolExecutor(max_workers=SCHEDULER_WORKERS, thread_name_prefix="refresh")
+_sched_lock = threading.Lock()
+_sched_wakeup = threading.Event()
+source_state = {name: {"running": False, "generation": 0, "started": None, "deadline": None, "next_run": 0.0,
+                       "done": threading.Event(), "ok_at": None, "runs": 0, "errors": 0, "timeouts": 0,
+                       "last_ms": None, "last_ok": None, "last_error": None}
+                for name in SOURCES}
+SECTION_SOURCES = {"trading": ["vix", "funding", "arb"], "ops": ["ops"], "news": ["news"],
+                   "signals": ["signals"], "org": ["org"]}
+SOURCE_SECTION = {src: section for section, srcs in SECTION_SOURCES.items() for src in srcs}
+
+# ─── Serialized snapshots ───────────────────────────────────────────
+# Each section is serialized and gzipped once per refresh, after the swap and outside
+# _sched_lock; read endpoints hand out the stored bytes (or a 304).
+SNAPSHOT_GZIP_LEVEL = int(os.environ.get("SNAPSHOT_GZIP_LEVEL", "6"))
+snapshots = {}  # section -> Snapshot; replaced whole, never mutated
+_snap_versions = dict.fromkeys(sections, 0)
+_snap_lock = threading.Lock()  # orders publishers only; readers never take it
+
+class Snapshot:
+    __slots__ = ("version", "value", "body", "gzip", "etag", "deltas")
+
+    def __init__(self, version, value):
+        self.version = version
+        self.value = value
+        self.body = json.dumps(value, separators=(",", ":")).encode()
+        self.gzip = gzip.compress(self.body, SNAPSHOT_GZIP_LEVEL, mtime=0)
+        self.etag = hashlib.sha1(self.body).hexdigest()[:20]
+        self.deltas = {}  # base version -> serialized delta from it to this snapshot
+
+def _commit_source(name, result, fetched):
+    """Swap in the section updated with a source's result, stamped with the epoch time it
+    was fetched at (the leader's, on followers, so every worker serializes the same bytes
+    and ETags). Caller holds _sched_lock. Returns (section, version, value) for _publish_section."""
+    section = SOURCE_SECTION[name]
+    value = sections[section] = SOURCES[name]["apply"](sections[section], result, _now_str(fetched))
+    _snap_versions[section] += 1
+    return section, _snap_versions[section], value
+
+def _publish_section(section, version, value):
+    snap = Snapshot(version, value)
+    with _snap_lock:
+        current = snapshots.get(section)
+        if current is None or current.version < version:
+            snapshots[section] = snap
+            _snap_history[section].append(snap)
+            _notify_stream(section, snap)
+
+def snapshot_response(section):
+    snap = snapshots[section]
+    base = _since_base(section, request.args.get("since"))
+    if base is not None:
+        return Response(_delta_body(section, base, snap), mimetype="application/json",
+                        headers={"Cache-Control": "no-cache", "X-Snapshot-Version": str(snap.version)})
+    gz = "gzip" in request.headers.get("Accept-Encoding", "")
+    headers = {"ETag": f'"{snap.etag}.gz"' if gz else f'"{snap.etag}"', "Vary": "Accept-Encoding",
+               "Cache-Control": "no-cache", "X-Snapshot-Version": str(snap.version)}
+    inm = request.if_none_match
+    if inm.star_tag or inm.contains(snap.etag) or inm.contains(snap.etag + ".gz"):
+        return Response(status=304, headers=headers)
+    if gz:
+        headers["Content-Encoding"] = "gzip"
+    return Response(snap.gzip if gz else snap.body, mimetype="application/json", headers=headers)
+
+# ─── Deltas ─────────────────────────────────────────────────────────
+# `?since=<version or etag>` returns a structural diff from a recent snapshot:
+#   set / unset: [path, value] / path for changed or removed fields
+#   rows: [path, {fields, added, removed, changed, order}] for lists of rows with a stable id
+# Row ids are the JSON array of the `fields` values. Bases older than SNAPSHOT_HISTORY
+# publishes get the full payload instead. ETags are content hashes, so they stay valid
+# across worker processes; versions are per process.
+SNAPSHOT_HISTORY = int(os.environ.get("SNAPSHOT_HISTORY", "32"))
+_snap_history = {section: deque(maxlen=SNAPSHOT_HISTORY) for section in sections}
+DELTA_ROW_KEYS = {
+    ("trading", "arb", "opps"): ("poly_title", "kalshi_title"),
+    ("trading", "funding", "top_positive"): ("symbol", "source"),
+    ("trading", "funding", "top_negative"): ("symbol", "source"),
+    ("trading", "funding", "spreads"): ("symbol",),
+    ("news", "headlines"): ("link", "title"),
+    ("signals", "markets"): ("title", "source"),
+    ("ops", "sessions"): ("time", "name"),
+    ("org", "teams"): ("name",),
+}
+_MISSING = object()
+
+def _row_id(row, fields):
+    return json.dumps([row.get(f) for f in fields], separators=(",", ":"), ensure_ascii=False)
+
+def _diff_rows(old, new, fields):
+    """Keyed row diff, or None when a list has non-dict rows or duplicate ids (it is then sent whole)."""
+    if not all(isinstance(r, dict) for r in old) or not all(isinstance(r, dict) for r in new):
+        return None
+    before = {_row_id(r, fields): r for r in old}
+    after = {_row_id(r, fields): r for r in new}
+    if len(before) != len(old) or len(after) != len(new):
+        return None
+    added = [r for k, r in after.items() if k not in before]
+    removed = [k for k in before if k not in after]
+    changed = {}
+    for k, r in after.items():
+        o = before.get(k)
+        if o is None or o == r:
+            continue
+        if o.keys() == r.keys():
+            changed[k] = {f: v for f, v in r.items() if o[f] != v}
+        else:
+            removed.append(k)
+            added.append(r)
+    return {"fields": fields, "added": added, "removed": removed, "changed": changed, "order": list(after)}
+
+def _diff(section, old, new, path, out):
+    for k in old:
+        if k not in new:
+            out["unset"].append(path + [k])
+    for k, v in new.items():
+        o, p = old.get(k, _MISSING), path + [k]
+        if o == v:
+            continue
+        if isinstance(o, dict) and isinstance(v, dict):
+            _diff(section, o, v, p, out)
+            continue
+        fields = DELTA_ROW_KEYS.get((section, *p))
+        rows = fields and isinstance(o, list) and isinstance(v, list) and _diff_rows(o, v, fields)
+        if rows:
+            out["rows"].append([p, rows])
+        else:
+            out["set"].append([p, v])
+
+def _since_base(section, since):
+    if since is None:
+        return None
+    return next((s for s in _snap_history[section] if since in (str(s.version), s.etag)), None)
+
+def _delta_body(section, base, snap):
+    body = snap.deltas.get(base.version)
+    if body is None:
+        out = {"set": [], "unset": [], "rows": []}
+        if base is not snap:
+            _diff(section, base.value, snap.value, [], out)
+        body = json.dumps({"delta": True, "since": base.version, "since_etag": base.etag,
+                           "version": snap.version, "etag": snap.etag, **out}, separators=(",", ":")).encode()
+        snap.deltas[base.version] = body
+    return body
+
+# ─── Push stream ────────────────────────────────────────────────────
+# /api/stream clients get a section's snapshot as soon as it is published. Each
+# client keeps only the newest unsent snapshot per section, so a slow reader is
+# never sent a backlog and never holds up the publisher.
+STREAM_HEARTBEAT = float(os.environ.get("STREAM_HEARTBEAT", "15"))
+STREAM_MAX_CLIENTS = int(os.environ.get("STREAM_MAX_CLIENTS", "200"))
+_stream_clients = set()
+_stream_lock = threading.Lock()
+
+class StreamClient:
+    def __init__(self, topics):
+        self.topics = topics
+        self.pending = {}
+        self.cond = threading.Condition()
+
+    def offer(self, section, snap):
+        with self.cond:
+            self.pending[section] = snap
+            self.cond.notify()
+
+    def take(self, timeout):
+        with self.cond:
+            if not self.pending:
+                self.cond.wait(timeout)
+            pending, self.pending = self.pending, {}
+        return pending
+
+def _notify_stream(section, snap):
+    with _stream_lock:
+        clients = [c for c in _stream_clients if section in c.topics]
+    for c in clients:
+        c.offer(section, snap)
+
+def stream_events(client):
+    """SSE frames for one client: current snapshots first, then each update, with heartbeat comments."""
+    with _stream_lock:
+        _stream_clients.add(client)
+    try:
+        yield b"retry: 5000\n\n"
+        for section in client.topics:
+            client.offer(section, snapshots[section])
+        while True:
+            pending = client.take(STREAM_HEARTBEAT)
+            if not pending:
+                yield b": heartbeat\n\n"
+            for section, snap in pending.items():
+                yield b"event: %s\nid: %s\ndata: %s\n\n" % (section.encode(), snap.etag.encode(), snap.body)
+    finally:
+        with _stream_lock:
+            _stream_clients.discard(client)
+
+for _section, _value in sections.items():
+    _publish_section(_section, 0, _value)
+
+def _reschedule(name, now):
+    src = SOURCES[name]
+    source_state[name]["next_run"] = now + src["interval"] + random.uniform(0, src["jitter"])
+
+def _run_source(name, generation):
+    src, st = SOURCES[name], source_state[name]
+    t0 = time.monotonic()
+    try:
+        result = src["fetch"]()
+        error = None
+    except Exception as e:
+        result, error = None, f"{type(e).__name__}: {e}"
+    now, fetched = time.monotonic(), time.time()
+    with _sched_lock:
+        if st["generation"] != generation:
+            return  # run was abandoned at its deadline; a newer one owns the slot
+        if error is None:
+            snap = _commit_source(name, result, fetched)
+            st["last_ok"] = _now_str(fetched)
+            st["ok_at"] = now
+        else:
+            st["errors"] += 1
+            st["last_error"] = error
+        st["runs"] += 1
+        st["last_ms"] = round((now - t0) * 1000)
+        st["running"] = False
+        done = st["done"]
+        _reschedule(name, now)
+    if error is None:
+        _publish_section(*snap)
+    done.set()  # after publishing, so ?wait=1 callers read the new snapshot
+    if error is None and cluster["role"] == "leader":
+        _publish_shared(name, result, fetched)
+    _sched_wakeup.set()
+
+def _dispatch(name, now):
+    """Start a run of `name` on the worker pool. Caller holds _sched_lock."""
+    st = source_state[name]
+    st["generation"] += 1
+    st.update(running=True, started=now, deadline=now + SOURCES[name]["timeout"], done=threading.Event())
+    _scheduler_pool.submit(_run_source, name, st["generation"])
+
+def run_scheduler():
+    while True:
+        now = time.monotonic()
+        with _sched_lock:
+            for name, st in source_state.items():
+                if st["running"] and now > st["deadline"]:
+                    # Threads cannot be cancelled: abandon the run, drop its late result, retry on schedule
+                    st["generation"] += 1
+                    st["running"] = False
+                    st["timeouts"] += 1
+                    st["last_error"] = f"timed out after {SOURCES[name]['timeout']:.0f}s"
+                    st["done"].set()
+                    _reschedule(name, now)
+            due = sorted((SOURCES[n]["priority"], n) for n, st in source_state.items()
+                         if not st["running"] and st["next_run"] <= now)
+            try:
+                for _, name in due:
+                    _dispatch(name, now)
+            except RuntimeError:
+                return  # pool shut down: interpreter is exiting
+            wake = [st["deadline"] if st["running"] else st["next_run"] for st in source_state.values()]
+        _sched_wakeup.wait(timeout=min(max(min(wake) - now, 0.05), 5))
+        _sched_wakeup.clear()
+
+def request_refresh(name):
+    """Single-flight refresh: start a run of `name` unless one is already in flight.
+
+    Returns (completion event, whether this call started the run). Concurrent callers
+    all get the event of the same run, so a burst triggers at most one upstream fetch."""
+    with _sched_lock:
+        st = source_state[name]
+        started = not st["running"]
+        if started and cluster["role"] == "follower":
+            _request_shared_refresh(name)
+        elif started:
+            _dispatch(name, time.monotonic())
+        return st["done"], started
+
+def revalidate(section, max_age):
+    """Stale-while-revalidate: kick off background refreshes for a section's sources
+    older than max_age seconds and return immediately."""
+    now = time.monotonic()
+    for name in SECTION_SOURCES[section]:
+        ok_at = source_state[name]["ok_at"]
+        if ok_at is None or now - ok_at > max_age:
+            request_refresh(name)
+
+def _max_age_revalidate(section):
+    max_age = request.args.get("max_age", type=float)
+    if max_age is not None:
+        revalidate(section, max_age)
+
+def scheduler_status():
+    now = time.monotonic()
+    with _sched_lock:
+        return {name: {"interval": SOURCES[name]["interval"], "jitter": SOURCES[name]["jitter"],
+                       "timeout": SOURCES[name]["timeout"], "priority": SOURCES[name]["priority"],
+                       "running": st["running"],
+                       "running_for": round(now - st["started"], 1) if st["running"] else None,
+                       "next_in": None if st["running"] else round(max(st["next_run"] - now, 0), 1),
+                       "runs": st["runs"], "errors": st["errors"], "timeouts": st["timeouts"],
+                       "age": round(now - st["ok_at"], 1) if st["ok_at"] is not None else None,
+                       "last_ms": st["last_ms"], "last_ok": st["last_ok"], "last_error": st["last_error"]}
+                for name, st in source_state.items()}
+
+# ─── Multi-process shared cache ─────────────────────────────────────
+# With SHARED_CACHE_DB set, every web worker process serves from one
+# SQLite snapshot. A non-blocking flock on <db>.leader elects the single
+# process that runs the scheduler and publishes each source result;
+# followers poll for newer versions and forward on-demand refreshes to
+# the leader. If the leader dies its lock is released and the next
+# follower to poll takes over.
+SHARED_CACHE_DB = os.environ.get("SHARED_CACHE_DB", "")
+SHARED_CACHE_POLL = float(os.environ.get("SHARED_CACHE_POLL", "1"))
+cluster = {"role": "standalone", "lock_file": None, "versions": {}}
+_shared_local = threading.local()
+
+def _shared_db():
+    conn = getattr(_shared_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(SHARED_CACHE_DB, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS sources (name TEXT PRIMARY KEY, version INTEGER NOT NULL,"
+                     " updated REAL NOT NULL, payload TEXT NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS refresh_requests (name TEXT NOT NULL, requested REAL NOT NULL)")
+        _shared_local.conn = conn
+    return conn
+
+def _share_payload(name, value, updated=None):
+    _shared_db().execute(
+        "INSERT INTO sources (name, version, updated, payload) VALUES (?, 1, ?, ?) "
+        "ON CONFLICT(name) DO UPDATE SET version = version + 1, updated = excluded.updated, "
+        "payload = excluded.payload", (name, time.time() if updated is None else updated, json.dumps(value)))
+
+def _publish_shared(name, result, fetched):
+    try:
+        _share_payload(name, result, fetched)
+    except sqlite3.Error as e:
+        source_state[name]["last_error"] = f"shared cache write failed: {e}"
+
+def arb_markets():
+    """The last fetched arb markets: ours, or on a follower the leader's (rows whose name
+    is not a source, like this one, are skipped by _pull_shared)."""
+    if cluster["role"] == "follower":
+        try:
+            row = _shared_db().execute("SELECT payload FROM sources WHERE name = '_arb_markets'").fetchone()
+        except sqlite3.Error:
+            row = None
+        if row:
+            return json.loads(row[0])
+    return _arb_snapshot
+
+def _request_shared_refresh(name):
+    """Follower side of request_refresh: queue the request for the leader. Caller holds _sched_lock."""
+    st = source_state[name]
+    now = time.monotonic()
+    st.update(running=True, started=now, deadline=now + SOURCES[name]["timeout"], done=threading.Event())
+    try:
+        _shared_db().execute("INSERT INTO refresh_requests (name, requested) VALUES (?, ?)", (name, time.time()))
+    except sqlite3.Error as e:
+        st.update(running=False, last_error=f"shared refresh request failed: {e}")
+        st["done"].set()
+
+def _pull_shared():
+    """Load every source whose shared version is newer than ours into the local cache."""
+    rows = _shared_db().execute("SELECT name, version, updated, payload FROM sources").fetchall()
+    now_mono, now_wall = time.monotonic(), time.time()
+    for name, version, updated, payload in rows:
+        if name not in SOURCES or cluster["versions"].get(name) == version:
+            continue
+        value = json.loads(payload)
+        done = None
+        with _sched_lock:
+            snap = _commit_source(name, value, updated)
+            st = source_state[name]
+            st["ok_at"] = now_mono - max(now_wall - updated, 0)
+            st["last_ok"] = _now_str(updated)
+            if st["running"] and cluster["role"] == "follower" and updated >= now_wall - (now_mono - st["started"]):
+                st["running"] = False
+                done = st["done"]
+        _publish_section(*snap)
+        if done:
+            done.set()
+        cluster["versions"][name] = version
+
+def _try_lead():
+    try:
+        import fcntl
+    except ImportError:
+        return True  # no flock on this platform: every process fetches for itself
+    f = open(SHARED_CACHE_DB + ".leader", "a+")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return False
+    f.seek(0); f.truncate(); f.write(str(os.getpid())); f.flush()
+    cluster["lock_file"] = f  # held for the life of the process
+    return True
+
+def _become_leader():
+    """Start the scheduler, resuming each source's cadence from the shared snapshot age."""
+    now = time.monotonic()
+    with _sched_lock:
+        cluster["role"] = "leader"
+        for name, st in source_state.items():
+            if st["running"]:  # pending follower request: let the scheduler pick it up now
+                st["running"] = False
+                st["done"].set()
+            elif st["ok_at"] is not None:
+                st["next_run"] = st["ok_at"] + SOURCES[name]["interval"]
+    threading.Thread(target=run_scheduler, daemon=True, name="scheduler").start()
+
+def run_cluster():
     while True:
-        vix = fetch_vix()
-        funding = fetch_funding()
-        arb = fetch_arb()
-        ops = compute_ops_data()
-        news = fetch_news()
-        sigs = fetch_signals()
-        org = compute_org()
-        with lock:
-            cache["vix"] = vix
-            cache["funding"] = funding
-            cache["arb"] = arb
-            cache["updated"] = datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S UTC")
-            ops_cache.update(ops)
-            news_cache["headlines"] = news
-            news_cache["updated"] = datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S UTC")
-            signals_cache["markets"] = sigs
-            signals_cache["updated"] = datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S UTC")
-            org_cache.update(org)
-        time.sleep(300)
-
-threading.Thread(target=refresh, daemon=True).start()
+        try:
+            if cluster["role"] != "leader":
+                _pull_shared()
+                if _try_lead():
+                    _become_leader()
+                else:
+                    cluster["role"] = "follower"
+                    now = time.monotonic()
+                    with _sched_lock:
+                        for st in source_state.values():
+                            if st["running"] and now > st["deadline"]:
+                                st["running"] = False
+                                st["done"].set()
+            else:
+                conn = _shared_db()
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    pending = {n for (n,) in conn.execute("SELECT DISTINCT name FROM refresh_requests")}
+                    conn.execute("DELETE FROM refresh_requests")
+                finally:
+                    conn.execute("COMMIT")
+                for name in pending & set(SOURCES):
+                    request_refresh(name)
+        except sqlite3.Error:
+            pass  # transient lock contention; retry next poll
+        time.sleep(SHARED_CACHE_POLL)
+
+def cluster_status():
+    return {"role": cluster["role"], "pid": os.getpid(), "shared_cache": SHARED_CACHE_DB or None,
+            "versions": dict(cluster["versions"])}
+
+def start_refresh():
+    if SHARED_CACHE_DB:
+        threading.Thread(target=run_cluster, daemon=True, name="cluster").start()
+    else:
+        threading.Thread(target=run_scheduler, daemon=True, name="scheduler").start()
+
+start_refresh()
 
 # ═══════════════════════════════════════════════════════════════════
 # API ROUTES
 # ═══════════════════════════════════════════════════════════════════
 
+@app.route("/api/refresh/<source>", methods=["GET", "POST"])
+def api_refresh(source):
+    names = SECTION_SOURCES.get(source, [source])
+    if any(n not in SOURCES for n in names):
+        return jsonify({"error": f"unknown source {source!r}", "sources": list(SOURCES)}), 404
+    runs = {n: request_refresh(n) for n in names}
+    if request.args.get("wait", "0") == "1":
+        for n, (done, _) in runs.items():
+            done.wait(SOURCES[n]["timeout"])
+    status = scheduler_status()
+    return jsonify({n: {"started": started, "joined": not started, "done": done.is_set(),
+                        "last_ok": status[n]["last_ok"], "last_error": status[n]["last_error"]}
+                    for n, (done, started) in runs.items()})
+
 @app.route("/api/trading")
 def api_trading():
-    with lock:
-        return jsonify(cache)
+    _max_age_revalidate("trading")
+    return snapshot_response("trading")
+
+@app.route("/api/arb/compare")
+def api_arb_compare():
+    return jsonify(compare_arb_scorers())
+
+@app.route("/api/arb/cache")
+def api_arb_cache():
+    return jsonify(sim_cache_stats())
+
+@app.route("/api/funding/history")
+def api_funding_history():
+    symbol = canonical_symbol(request.args.get("symbol", ""))
+    if not symbol:
+        return jsonify({"error": "need symbol"}), 400
+    try:
+        start = float(request.args["start"]) if "start" in request.args else None
+        end = float(request.args["end"]) if "end" in request.args else None
+        limit = int(request.args["limit"]) if "limit" in request.args else None
+    except ValueError:
+        return jsonify({"error": "start/end must be epoch seconds, limit an integer"}), 400
+    exchange = request.args.get("exchange")
+    series = {}
+    for ex in ([exchange] if exchange else funding_history.exchanges_for(symbol)):
+        points = funding_history.query(ex, symbol, start, end, limit)
+        if points is not None:
+            series[ex] = [[ts, round(rate*100, 4)] for ts, rate in points]
+    if not series:
+        return jsonify({"error": "no history for symbol"}), 404
+    return jsonify({"symbol": symbol, "series": series})
+
+@app.route("/api/scheduler")
+def api_scheduler():
+    return jsonify(scheduler_status())
+
+@app.route("/api/cluster")
+def api_cluster():
+    return jsonify(cluster_status())
+
+@app.route("/api/upstreams")
+def api_upstreams():
+    return jsonify(upstream_health())
+
+BATCH_EXTRAS = {"upstreams": upstream_health, "portfolio": compute_portfolio, "crypto": compute_crypto_portfolio,
+                "etf": compute_etf_portfolio, "signals_portfolio": compute_signals_portfolio}
+
+@app.route("/api/batch")
+def api_batch():
+    """Several sections in one response. Refreshed sections are spliced in from their stored
+    snapshot bytes (or a delta, for bases named in `since=<section>:<etag>,...`); the rest
+    are computed. `_etags` carries each snapshot section's current ETag."""
+    names = list(dict.fromkeys(n for n in request.args.get("sections", "").split(",") if n))
+    unknown = [n for n in names if n not in sections and n not in BATCH_EXTRAS]
+    if unknown or not names:
+        return jsonify({"error": f"unknown sections {unknown}", "sections": [*sections, *BATCH_EXTRAS]}), 404
+    since = dict(s.split(":", 1) for s in request.args.get("since", "").split(",") if ":" in s)
+    parts, etags = [], {}
+    for name in names:
+        if name in sections:
+            _max_age_revalidate(name)
+            snap = snapshots[name]
+            base = _since_base(name, since.get(name))
+            body = _delta_body(name, base, snap) if base is not None else snap.body
+            etags[name] = snap.etag
+        else:
+            body = json.dumps(BATCH_EXTRAS[name](), separators=(",", ":")).encode()
+        parts.append(b'"%s":%s' % (name.encode(), body))
+    parts.append(b'"_etags":' + json.dumps(etags).encode())
+    body = b"{" + b",".join(parts) + b"}"
+    etag = hashlib.sha1(body).hexdigest()[:20]
+    headers = {"ETag": f'"{etag}"', "Cache-Control": "no-cache"}
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers=headers)
+    return Response(body, mimetype="application/json", headers=headers)
+
+@app.route("/api/stream")
+def api_stream():
+    topics = [t for t in request.args.get("topics", ",".join(sections)).split(",") if t]
+    unknown = [t for t in topics if t not in sections]
+    if unknown or not topics:
+        return jsonify({"error": f"unknown topics {unknown}", "topics": list(sections)}), 404
+    if len(_stream_clients) >= STREAM_MAX_CLIENTS:
+        return jsonify({"error": "too many stream clients"}), 503
+    return Response(stream_events(StreamClient(set(topics))), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.route("/api/ops")
 def api_ops():
-    with lock:
-        return jsonify(ops_cache)
+    _max_age_revalidate("ops")
+    return snapshot_response("ops")
 
 @app.route("/api/ops/log", methods=["POST"])
 def api_ops_log():
@@ -690,29 +2832,18 @@ def api_portfolio_trade():
     trade = request.get_json()
     if not trade:
         return jsonify({"error": "no data"}), 400
-    data = load_portfolio()
     trade["timestamp"] = datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M")
-    data.setdefault("trades", []).append(trade)
-    # Update positions if provided
-    if "strategy" in trade and "new_value" in trade:
-        for p in data["positions"]:
-            if p["strategy"] == trade["strategy"]:
-                old = p["current_value"]
-                p["current_value"] = float(trade["new_value"])
-                p["pnl"] = round(p["current_value"] - p["entry_price"], 2)
-                p["status"] = trade.get("status", p["status"])
-    save_portfolio(data)
-    return jsonify({"ok": True})
+    return jsonify(portfolio_writer.submit(_trade_mutation(trade)))
 
 @app.route("/api/news")
 def api_news():
-    with lock:
-        return jsonify(news_cache)
+    _max_age_revalidate("news")
+    return snapshot_response("news")
 
 @app.route("/api/signals")
 def api_signals():
-    with lock:
-        return jsonify(signals_cache)
+    _max_age_revalidate("signals")
+    return snapshot_response("signals")
 
 @app.route("/api/signals/view", methods=["POST"])
 def api_signals_view():
@@ -731,9 +2862,7 @@ def api_signals_trade():
     body = request.get_json()
     if not body or "market" not in body:
         return jsonify({"error": "need at least 'market'"}), 400
-    data = load_signals_book()
     trade = {
-        "id": len(data.get("trades", [])) + 1,
         "timestamp": body.get("timestamp", datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M")),
         "market": body["market"],
         "direction": body.get("direction", "long"),
@@ -747,28 +2876,31 @@ def api_signals_trade():
         "pnl": None,
         "status": "open",
     }
-    data.setdefault("trades", []).append(trade)
-    save_signals_book(data)
-    return jsonify({"ok": True, "trade_id": trade["id"]})
+    return jsonify(signals_writer.submit(_trade_mutation(trade)))
 
 @app.route("/api/signals/trade/exit", methods=["POST"])
 def api_signals_trade_exit():
     body = request.get_json()
     if not body or "trade_id" not in body or "exit_price" not in body:
         return jsonify({"error": "need trade_id and exit_price"}), 400
-    data = load_signals_book()
     trade_id = int(body["trade_id"])
-    for t in data.get("trades", []):
-        if t.get("id") == trade_id and t.get("status") == "open":
-            t["exit_timestamp"] = body.get("exit_timestamp", datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M"))
-            t["exit_price"] = float(body["exit_price"])
-            t["exit_screenshot_path"] = body.get("screenshot_path", "")
-            multiplier = 1 if t["direction"] == "long" else -1
-            t["pnl"] = round((t["exit_price"] - t["entry_price"]) * t["size"] * multiplier, 2)
-            t["status"] = "closed"
-            save_signals_book(data)
-            return jsonify({"ok": True, "pnl": t["pnl"]})
-    return jsonify({"error": "trade not found or already closed"}), 404
+    fields = {"exit_timestamp": body.get("exit_timestamp", datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M")),
+              "exit_price": float(body["exit_price"]),
+              "exit_screenshot_path": body.get("screenshot_path", "")}
+    def prepare(data):
+        trades = data.get("trades", [])
+        slot = next((i for i in signals_book.trade_slots(trade_id, data)
+                     if trades[i].get("id") == trade_id and trades[i].get("status") == "open"), None)
+        if slot is None:
+            return None, []
+        return (lambda results: {"ok": True, "pnl": results[0]["pnl"]}), [("exit", (trade_id, fields, slot))]
+    try:
+        ack = signals_writer.submit(prepare)
+    except LookupError:  # closed by another process after our view was read
+        ack = None
+    if ack is None:
+        return jsonify({"error": "trade not found or already closed"}), 404
+    return jsonify(ack)
 
 @app.route("/api/signals/screenshot", methods=["POST"])
 def api_signals_screenshot():
@@ -796,17 +2928,8 @@ def api_crypto_trade():
     trade = request.get_json()
     if not trade:
         return jsonify({"error": "no data"}), 400
-    data = load_crypto_portfolio()
     trade["timestamp"] = datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M")
-    data.setdefault("trades", []).append(trade)
-    if "position_id" in trade and "new_value" in trade:
-        for p in data.get("positions", []):
-            if p.get("id") == trade["position_id"]:
-                p["current_value"] = float(trade["new_value"])
-                p["pnl"] = round(p["current_value"] - p.get("cost_basis", 0), 2)
-                p["status"] = trade.get("status", p.get("status", "open"))
-    save_crypto_portfolio(data)
-    return jsonify({"ok": True})
+    return jsonify(crypto_writer.submit(_trade_mutation(trade)))
 
 @app.route("/api/etf")
 def api_etf():
@@ -817,17 +2940,8 @@ def api_etf_trade():
     trade = request.get_json()
     if not trade:
         return jsonify({"error": "no data"}), 400
-    data = load_etf_portfolio()
     trade["timestamp"] = datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M")
-    data.setdefault("trades", []).append(trade)
-    if "position_id" in trade and "new_value" in trade:
-        for p in data.get("positions", []):
-            if p.get("id") == trade["position_id"]:
-                p["current_value"] = float(trade["new_value"])
-                p["pnl"] = round(p["current_value"] - p.get("cost_basis", 0), 2)
-                p["status"] = trade.get("status", p.get("status", "open"))
-    save_etf_portfolio(data)
-    return jsonify({"ok": True})
+    return jsonify(etf_writer.submit(_trade_mutation(trade)))
 
 @app.route("/api/journal")
 def api_journal():
@@ -835,7 +2949,7 @@ def api_journal():
               "updated": datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S UTC")}
     # ── Main portfolio ──────────────────────────────────────────
     try:
-        main_data = load_portfolio()
+        main_data = portfolio_book.view()
         for i, p in enumerate(main_data.get("positions", [])):
             pos = dict(p)
             pos["portfolio"] = "Main"
@@ -862,7 +2976,7 @@ def api_journal():
         result["main_error"] = str(e)
     # ── Signals book ────────────────────────────────────────────
     try:
-        sig_data = load_signals_book()
+        sig_data = signals_book.view()
         for t in sig_data.get("trades", []):
             trade = dict(t)
             trade["portfolio"] = "Signals"
@@ -889,7 +3003,7 @@ def api_journal():
         result["signals_error"] = str(e)
     # ── ETF portfolio ────────────────────────────────────────────
     try:
-        etf_data = load_etf_portfolio()
+        etf_data = etf_book.view()
         for i, p in enumerate(etf_data.get("positions", [])):
             pos = dict(p)
             pos["portfolio"] = "ETF"
@@ -921,38 +3035,48 @@ def api_journal():
     return jsonify(result)
 
 
+def _main_position_index(data):
+    index = {}
+    for i, p in enumerate(data.get("positions", [])):
+        index.setdefault(str(p.get("id", f"pos_{i}")), p)
+        index.setdefault(f"pos_{i}", p)
+    return index
+
+def _etf_position_index(data):
+    index = {}
+    for i, p in enumerate(data.get("positions", [])):
+        index.setdefault(str(p.get("id", i)), p)
+    return index
+
 @app.route("/api/journal/trade/<portfolio>/<trade_id>")
 def api_journal_trade(portfolio, trade_id):
     try:
         if portfolio == "main":
-            data = load_portfolio()
-            for i, p in enumerate(data.get("positions", [])):
-                if str(p.get("id", f"pos_{i}")) == trade_id or f"pos_{i}" == trade_id:
-                    return jsonify({"portfolio": "Main", "trade_id": trade_id, **p})
-            for i, t in enumerate(data.get("trades", [])):
-                if str(t.get("id", i)) == trade_id:
-                    return jsonify({"portfolio": "Main", "trade_id": trade_id, **t})
+            p = portfolio_book.summary(_main_position_index).get(trade_id)
+            if p is not None:
+                return jsonify({"portfolio": "Main", "trade_id": trade_id, **p})
+            t = portfolio_book.find_trade(trade_id)
+            if t is not None:
+                return jsonify({"portfolio": "Main", "trade_id": trade_id, **t})
         elif portfolio == "signals":
-            data = load_signals_book()
-            for t in data.get("trades", []):
-                if str(t.get("id", "")) == trade_id:
-                    return jsonify({"portfolio": "Signals", "trade_id": trade_id, **t})
+            t = signals_book.find_trade(trade_id)
+            if t is not None:
+                return jsonify({"portfolio": "Signals", "trade_id": trade_id, **t})
         elif portfolio == "etf":
-            data = load_etf_portfolio()
-            for i, p in enumerate(data.get("positions", [])):
-                if str(p.get("id", i)) == trade_id:
-                    return jsonify({"portfolio": "ETF", "trade_id": trade_id, **p})
-            for i, t in enumerate(data.get("trades", [])):
-                if str(t.get("id", i)) == trade_id:
-                    return jsonify({"portfolio": "ETF", "trade_id": trade_id, **t})
+            p = etf_book.summary(_etf_position_index).get(trade_id)
+            if p is not None:
+                return jsonify({"portfolio": "ETF", "trade_id": trade_id, **p})
+            t = etf_book.find_trade(trade_id)
+            if t is not None:
+                return jsonify({"portfolio": "ETF", "trade_id": trade_id, **t})
         return jsonify({"error": "trade not found"}), 404
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route("/api/org")
 def api_org():
-    with lock:
-        return jsonify(org_cache)
+    _max_age_revalidate("org")
+    return snapshot_response("org")
 
 @app.route("/")
 def index():
@@ -1272,7 +3396,10 @@ function renderTrading(d){
         '<div class="note">'+(s.kind==='CONTANGO'?'Normal — no panic':'⚠️ Fear elevated')+'</div>'+
         '<div class="stat-row"><span class="label">VIX</span><span class="val">'+v.current+'</span></div>'+
         '<div class="stat-row"><span class="label">VIX3M</span><span class="val">'+s.vix3m+'</span></div>'+
-        '<div class="stat-row"><span class="label">Ratio</span><span class="val">'+s.ratio+'</span></div>';
+        '<div class="stat-row"><span class="label">Ratio</span><span class="val">'+s.ratio+'</span></div>'+
+        (v.term_structure?v.term_structure.curve.map(function(c){return '<div class="stat-row"><span class="label">'+c.tenor+' ('+c.days+'d)</span><span class="val">'+c.level+'</span></div>'}).join('')+
+          v.term_structure.segments.map(function(g){return '<div class="stat-row"><span class="label">'+g.from+' → '+g.to+'</span><span class="val"><span class="tag '+g.kind.toLowerCase()+'">'+(g.slope_30d>0?'+':'')+g.slope_30d+'/30d</span></span></div>'}).join('')+
+          (v.term_structure.vvix?'<div class="stat-row"><span class="label">VVIX</span><span class="val">'+v.term_structure.vvix+'</span></div>':''):'');
     } else { $('structure-card').innerHTML='<h2><span class="icon">📐</span> TERM STRUCTURE</h2><div class="empty">VIX3M unavailable</div>'; }
   } else {
     $('vix-card').innerHTML='<h2><span class="icon">📊</span> VIX MONITOR</h2><div class="empty">'+(v?v.error:'Loading…')+'</div>';
@@ -1286,6 +3413,8 @@ function renderTrading(d){
       '<table><tr><th>Symbol</th><th>Rate/8h</th><th>Ann.</th><th class="hide-mobile">Src</th></tr>'+rows(f.top_positive)+'</table></div>'+
       '<div><h2 style="font-size:11px;color:var(--red)">📉 MOST NEGATIVE (Long Opps)</h2>'+
       '<table><tr><th>Symbol</th><th>Rate/8h</th><th>Ann.</th><th class="hide-mobile">Src</th></tr>'+rows(f.top_negative)+'</table></div></div>'+
+      (f.spreads&&f.spreads.length?'<h2 style="font-size:11px;color:var(--cyan);margin-top:12px">⚖️ CROSS-VENUE SPREADS</h2>'+
+      '<table><tr><th>Symbol</th><th>Long</th><th>Short</th><th>Spread/8h</th><th>Ann.</th></tr>'+f.spreads.map(function(x){return '<tr><td>'+x.symbol+'</td><td><span class="badge">'+x.long+'</span> '+x.long_rate_8h+'%</td><td><span class="badge">'+x.short+'</span> '+x.short_rate_8h+'%</td><td class="pos">'+x.spread_8h+'%</td><td class="pos">'+x.spread_ann+'%</td></tr>'}).join('')+'</table>':'')+
       '<div style="margin-top:8px;color:var(--dim);font-size:11px">Market avg: '+f.avg_rate+'%/8h ('+f.avg_ann+'% ann) • Sources: '+f.sources.join(', ')+'</div>';
   } else {
     $('funding-card').innerHTML='<h2><span class="icon">💰</span> FUNDING RATES</h2><div class="empty">'+(f?f.error||'No data':'Loading…')+'</div>';
@@ -1501,7 +3630,7 @@ async function setTeamView(title, inputId) {
 }
 
 // ═══ OPS RENDER ══════════════════════════════════════════════
-function renderOps(d){
+function renderOps(d, u){
   const t = d.totals || {};
   const sessions = d.sessions || [];
   const tiers = d.tiers || {};
@@ -1556,6 +3685,24 @@ function renderOps(d){
   html += '</div>';
   html += '</div>';
 
+  const ups = Object.entries(u || {});
+  if (ups.length) {
+    const stateColor = {'closed':'var(--green)','half-open':'var(--yellow)','open':'var(--red)'};
+    html += '<div class="card full" style="margin-top:14px">';
+    html += '<h2><span class="icon">🩺</span> UPSTREAM HEALTH</h2>';
+    html += '<div style="overflow-x:auto"><table>';
+    html += '<tr><th>Upstream</th><th>Circuit</th><th>Calls</th><th>Err Rate</th><th>p50</th><th>p95</th><th>Last OK</th><th>Last Error</th></tr>';
+    ups.forEach(function([name, s]) {
+      html += '<tr><td>'+name+(s.stale?' <span style="color:var(--yellow)">(stale)</span>':'')+'</td>';
+      html += '<td style="color:'+stateColor[s.state]+'">'+s.state.toUpperCase()+(s.retry_in!=null?' · '+s.retry_in+'s':'')+'</td>';
+      html += '<td>'+s.calls+(s.skipped?' <span style="color:var(--dim)">+'+s.skipped+' skipped</span>':'')+'</td>';
+      html += '<td class="'+(s.error_rate>0?'neg':'pos')+'">'+Math.round(s.error_rate*100)+'%</td>';
+      html += '<td>'+(s.p50_ms!=null?s.p50_ms+'ms':'—')+'</td><td>'+(s.p95_ms!=null?s.p95_ms+'ms':'—')+'</td>';
+      html += '<td style="color:var(--dim)">'+(s.last_ok||'—')+'</td><td style="color:var(--dim)">'+(s.last_error||'')+'</td></tr>';
+    });
+    html += '</table></div></div>';
+  }
+
   $('ops-content').innerHTML = html;
 }
 
@@ -1622,30 +3769,71 @@ function renderOrg(d) {
 }
 
 // ═══ DATA LOADERS ════════════════════════════════════════════
+// Section payloads are kept client-side; later loads ask for ?since=<etag> and
+// patch the kept copy with the returned delta (the server sends the full payload
+// when that base has expired). A delta is only applied to the base it names: if the
+// stream replaced the kept copy while the request was out, the section is refetched whole.
+const sectionState = {};
+function applyDelta(base, d){
+  const data = JSON.parse(JSON.stringify(base));
+  const parentOf = p => p.slice(0,-1).reduce((o,k)=>o[k], data);
+  d.unset.forEach(function(p){ delete parentOf(p)[p[p.length-1]]; });
+  d.set.forEach(function([p,v]){ parentOf(p)[p[p.length-1]] = v; });
+  d.rows.forEach(function([p,r]){
+    const parent = parentOf(p), last = p[p.length-1];
+    const id = row => JSON.stringify(r.fields.map(f => row[f] === undefined ? null : row[f]));
+    const rows = {};
+    parent[last].forEach(function(row){ rows[id(row)] = row; });
+    r.removed.forEach(function(k){ delete rows[k]; });
+    r.added.forEach(function(row){ rows[id(row)] = row; });
+    Object.entries(r.changed).forEach(function([k,f]){ Object.assign(rows[k], f); });
+    parent[last] = r.order.map(k => rows[k]);
+  });
+  return data;
+}
+function keepSection(name, etag, data){ sectionState[name] = {etag: etag, data: data}; return data; }
+// One /api/batch round trip for several sections (see BATCH_EXTRAS for the non-cached ones)
+async function fetchSections(names){
+  const since = names.filter(n => sectionState[n]).map(n => n+':'+sectionState[n].etag);
+  const r = await fetch('/api/batch?sections='+names.join(',')+(since.length ? '&since='+since.join(',') : ''));
+  const b = await r.json();
+  const out = {}, refetch = [];
+  names.forEach(function(n){
+    const d = b[n];
+    if (!(n in b._etags)) { out[n] = d; return; }
+    if (d.delta && (!sectionState[n] || sectionState[n].etag !== d.since_etag)) { refetch.push(n); return; }
+    out[n] = keepSection(n, b._etags[n], d.delta ? applyDelta(sectionState[n].data, d) : d);
+  });
+  if (refetch.length) {
+    refetch.forEach(function(n){ delete sectionState[n]; });
+    Object.assign(out, await fetchSections(refetch));
+  }
+  return out;
+}
+async function fetchSection(name){ return (await fetchSections([name]))[name]; }
 async function loadTrading(){
-  try{const r=await fetch('/api/trading');const d=await r.json();renderTrading(d)}catch(e){console.error(e)}
+  try{renderTrading(await fetchSection('trading'))}catch(e){console.error(e)}
 }
 async function loadOps(){
-  try{const r=await fetch('/api/ops');const d=await r.json();renderOps(d)}catch(e){console.error(e)}
+  try{const b=await fetchSections(['ops','upstreams']);renderOps(b.ops,b.upstreams)}catch(e){console.error(e)}
 }
 async function loadPortfolio(){
-  try{const r=await fetch('/api/portfolio');const d=await r.json();renderPortfolio(d)}catch(e){console.error(e)}
+  try{renderPortfolio(await fetchSection('portfolio'))}catch(e){console.error(e)}
 }
 async function loadNews(){
   try{
-    const [nr,sr,sbr]=await Promise.all([fetch('/api/news'),fetch('/api/signals'),fetch('/api/signals/portfolio')]);
-    const [nd,sd,sbd]=await Promise.all([nr.json(),sr.json(),sbr.json()]);
-    renderNews(nd,sd,sbd);
+    const b=await fetchSections(['news','signals','signals_portfolio']);
+    renderNews(b.news,b.signals,b.signals_portfolio);
   }catch(e){console.error(e)}
 }
 async function loadOrg(){
-  try{const r=await fetch('/api/org');const d=await r.json();renderOrg(d)}catch(e){console.error(e)}
+  try{renderOrg(await fetchSection('org'))}catch(e){console.error(e)}
 }
 async function loadCrypto(){
-  try{const r=await fetch('/api/crypto');const d=await r.json();renderCrypto(d)}catch(e){console.error(e)}
+  try{renderCrypto(await fetchSection('crypto'))}catch(e){console.error(e)}
 }
 async function loadETF(){
-  try{const r=await fetch('/api/etf');const d=await r.json();renderETF(d)}catch(e){console.error(e)}
+  try{renderETF(await fetchSection('etf'))}catch(e){console.error(e)}
 }
 
 function renderCrypto(d) {
@@ -2041,20 +4229,40 @@ document.addEventListener('keydown', function(e) {
   }
 });
 
+// ─── Push stream ─────────────────────────────────────────────
+// Sections the server refreshes arrive over /api/stream; polling below only
+// covers them while the stream is down (or EventSource is unavailable).
+let streamLive = false;
+function activePage(){ const a = document.querySelector('.page.active'); return a ? a.id : ''; }
+function startStream(){
+  if(!window.EventSource) return;
+  const es = new EventSource('/api/stream?topics=trading,ops,news,signals,org');
+  es.onopen = function(){ streamLive = true; };
+  es.onerror = function(){ streamLive = false; };  // EventSource reconnects by itself
+  es.addEventListener('trading', function(e){ renderTrading(keepSection('trading', e.lastEventId, JSON.parse(e.data))); });
+  es.addEventListener('org', function(e){
+    const d = keepSection('org', e.lastEventId, JSON.parse(e.data));
+    if(activePage()==='page-org') renderOrg(d);
+  });
+  es.addEventListener('ops', function(){ if(activePage()==='page-ops') loadOps(); });
+  es.addEventListener('news', function(){ if(activePage()==='page-news') loadNews(); });
+  es.addEventListener('signals', function(){ if(activePage()==='page-news') loadNews(); });
+}
+
 // Initial load
 loadTrading();
-setInterval(loadTrading,300000);
+startStream();
+setInterval(function(){ if(!streamLive) loadTrading(); },300000);
 setInterval(function(){
-  const active = document.querySelector('.page.active');
-  if(!active) return;
-  const id = active.id;
-  if(id==='page-ops') loadOps();
+  const id = activePage();
+  if(!id) return;
+  if(id==='page-ops' && !streamLive) loadOps();
   if(id==='page-portfolio') loadPortfolio();
   if(id==='page-journal') loadJournal();
-  if(id==='page-news') loadNews();
+  if(id==='page-news' && !streamLive) loadNews();
   if(id==='page-crypto') loadCrypto();
   if(id==='page-etf') loadETF();
-  if(id==='page-org') loadOrg();
+  if(id==='page-org' && !streamLive) loadOrg();
 },60000);
 </script>
 </body>